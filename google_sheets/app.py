@@ -1,8 +1,10 @@
+import asyncio
 import json
 import logging
+from contextlib import asynccontextmanager, suppress
 from datetime import datetime
 from os import environ
-from typing import Annotated, Any, Dict, List, Optional, Union
+from typing import Annotated, Any, AsyncIterator, Dict, List, Optional, Union
 
 import httpx
 import pandas as pd
@@ -10,6 +12,7 @@ from fastapi import Body, FastAPI, HTTPException, Query, Response, status
 from fastapi.responses import RedirectResponse
 from google.auth.exceptions import RefreshError
 from googleapiclient.errors import HttpError
+from starlette.types import ASGIApp, Receive, Scope, Send
 
 from . import __version__
 from .data_processing import (
@@ -18,16 +21,22 @@ from .data_processing import (
     validate_input_data,
     validate_output_data,
 )
-from .db_helpers import get_db_connection
+from .db_helpers import db_clients, get_db_connection, use_db_clients
 from .google_api import (
+    ValueRenderOption,
+    batch_get_sheets_f,
+    batch_update_sheets_f,
     build_service,
     create_sheet_f,
+    create_sheets_f,
     get_all_sheet_titles_f,
     get_files_f,
     get_google_oauth_url,
     get_sheet_f,
     get_token_request_data,
+    invalidate_user_credentials,
     oauth2_settings,
+    refresh_expiring_credentials,
     update_sheet_f,
 )
 from .model import GoogleSheetValues
@@ -43,13 +52,47 @@ base_url = (
     f"{protocol}://{host}:{port}" if host == "localhost" else f"{protocol}://{host}"
 )
 
+
+@asynccontextmanager
+async def lifespan(app: FastAPI) -> AsyncIterator[Dict[str, Any]]:
+    # Database clients are bound to the event loop serving the app
+    async with db_clients() as clients:
+        credentials_refresh = asyncio.create_task(refresh_expiring_credentials())
+        try:
+            # Requests don't run in the context of the lifespan, they get the
+            # clients through the lifespan state
+            yield {"db_clients": clients}
+        finally:
+            credentials_refresh.cancel()
+            # Let the task finish before the database clients are disconnected
+            with suppress(asyncio.CancelledError):
+                await credentials_refresh
+
+
 app = FastAPI(
     servers=[{"url": base_url, "description": "Google Sheets app server"}],
     version=__version__,
     title="google-sheets",
+    lifespan=lifespan,
 )
 
 
+class _DBClientsMiddleware:
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        clients = scope.get("state", {}).get("db_clients")
+        if clients is None:
+            await self.app(scope, receive, send)
+            return
+        with use_db_clients(clients):
+            await self.app(scope, receive, send)
+
+
+app.add_middleware(_DBClientsMiddleware)
+
+
 async def is_authenticated_for_ads(user_id: int) -> bool:
     async with get_db_connection() as db:
         data = await db.gauth.find_unique(where={"user_id": user_id})
@@ -140,6 +183,9 @@ async def login_callback(
             },
         )
 
+    # Don't keep using the credentials from before the new login
+    invalidate_user_credentials(user_id)
+
     logged_in_message = "I have successfully logged in"
     redirect_uri = f"{REDIRECT_DOMAIN}/chat/{chat_uuid}?msg={logged_in_message}"
     return RedirectResponse(redirect_uri)
@@ -165,6 +211,12 @@ async def get_sheet(
         Optional[str],
         Query(description="The title of the sheet to fetch data from"),
     ] = None,
+    value_render_option: Annotated[
+        ValueRenderOption,
+        Query(
+            description="How the values are rendered, as shown in the sheet by default"
+        ),
+    ] = "FORMATTED_VALUE",
 ) -> Union[str, GoogleSheetValues]:
     _check_parameters_are_not_none({"spreadsheet_id": spreadsheet_id, "title": title})
     service = await build_service(user_id=user_id, service_name="sheets", version="v4")
@@ -172,14 +224,29 @@ async def get_sheet(
         service=service,
         spreadsheet_id=spreadsheet_id,  # type: ignore
         range=title,  # type: ignore
+        value_render_option=value_render_option,
     )
 
+    return _to_sheet_values(values)
+
+
+def _to_sheet_values(values: List[List[Any]]) -> Union[str, GoogleSheetValues]:
     if not values:
         return "No data found."
 
     values = _fill_rows_with_none(values)
 
-    return GoogleSheetValues(values=values)
+    return GoogleSheetValues.model_construct(values=values)
+
+
+async def _get_sheets(
+    user_id: int, spreadsheet_id: str, titles: List[str]
+) -> List[Union[str, GoogleSheetValues]]:
+    service = await build_service(user_id=user_id, service_name="sheets", version="v4")
+    sheets_values = await batch_get_sheets_f(
+        service=service, spreadsheet_id=spreadsheet_id, ranges=titles
+    )
+    return [_to_sheet_values(values) for values in sheets_values]
 
 
 @app.post(
@@ -227,6 +294,17 @@ async def update_sheet(
     )
 
 
+def _create_sheet_http_exception(e: HttpError, titles: List[str]) -> HTTPException:
+    if e.status_code == status.HTTP_400_BAD_REQUEST:
+        for title in titles:
+            if f'A sheet with the name "{title}" already exists' in e._get_reason():
+                return HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail=f'A sheet with the name "{title}" already exists. Please enter another name.',
+                )
+    return HTTPException(status_code=e.status_code, detail=e._get_reason())
+
+
 @app.post(
     "/create-sheet",
     description="Create a new Google Sheet within the existing spreadsheet",
@@ -252,15 +330,7 @@ async def create_sheet(
             title=title,  # type: ignore
         )
     except HttpError as e:
-        if (
-            e.status_code == status.HTTP_400_BAD_REQUEST
-            and f'A sheet with the name "{title}" already exists' in e._get_reason()
-        ):
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail=f'A sheet with the name "{title}" already exists. Please enter another name.',
-            ) from e
-        raise HTTPException(status_code=e.status_code, detail=e._get_reason()) from e
+        raise _create_sheet_http_exception(e, titles=[title]) from e  # type: ignore[list-item]
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e)
@@ -277,10 +347,16 @@ async def get_all_file_names(
     user_id: Annotated[
         int, Query(description="The user ID for which the data is requested")
     ],
+    name_contains: Annotated[
+        Optional[str],
+        Query(description="Only return the sheets whose name contains this text"),
+    ] = None,
 ) -> Dict[str, str]:
     service = await build_service(user_id=user_id, service_name="drive", version="v3")
     try:
-        files: List[Dict[str, str]] = await get_files_f(service=service)
+        files: List[Dict[str, str]] = await get_files_f(
+            service=service, name_contains=name_contains
+        )
     except RefreshError as e:
         error_msg = "The user's credentials have expired. Please log in again with 'force_new_login' parameter set to 'True'.\n"
         error_msg += f"Error: {e!s}"
@@ -419,7 +495,9 @@ async def process_campaign_data(
     issues_present = "Issues" in validated_df.columns
     values = [validated_df.columns.tolist(), *validated_df.values.tolist()]
 
-    return GoogleSheetValues(values=values, issues_present=issues_present)
+    return GoogleSheetValues.model_construct(
+        values=values, issues_present=issues_present
+    )
 
 
 async def process_data(
@@ -496,7 +574,9 @@ async def process_data(
     issues_present = "Issues" in validated_df.columns
     values = [validated_df.columns.tolist(), *validated_df.values.tolist()]
 
-    return GoogleSheetValues(values=values, issues_present=issues_present)
+    return GoogleSheetValues.model_construct(
+        values=values, issues_present=issues_present
+    )
 
 
 async def process_campaigns_and_ad_groups(
@@ -536,29 +616,44 @@ async def process_campaigns_and_ad_groups(
     return pd.merge(campaign_template_df, ad_group_template_df, how="cross")
 
 
-async def _create_and_update_sheet(
+async def _create_and_update_sheets(
     user_id: int,
     new_campaign_spreadsheet_id: str,
-    processed_values: GoogleSheetValues,
-    target_resource: str,
+    processed_values: Dict[str, GoogleSheetValues],
 ) -> str:
-    title = (
-        f"Captn - {target_resource.capitalize()}s {datetime.now():%Y-%m-%d %H:%M:%S}"  # type: ignore
-    )
-    await create_sheet(
-        user_id=user_id,
-        spreadsheet_id=new_campaign_spreadsheet_id,
-        title=title,
-    )
-    await update_sheet(
-        user_id=user_id,
-        spreadsheet_id=new_campaign_spreadsheet_id,
-        title=title,
-        sheet_values=processed_values,
-    )
-    response = f"Sheet with the name '{title}' has been created successfully.\n"
-    if processed_values.issues_present:
-        response += """But there are issues present in the data.
+    now = datetime.now()
+    titles = {
+        target_resource: f"Captn - {target_resource.capitalize()}s {now:%Y-%m-%d %H:%M:%S}"
+        for target_resource in processed_values
+    }
+    service = await build_service(user_id=user_id, service_name="sheets", version="v4")
+    try:
+        # All sheets are created with one request and filled with another one
+        await create_sheets_f(
+            service=service,
+            spreadsheet_id=new_campaign_spreadsheet_id,
+            titles=list(titles.values()),
+        )
+        await batch_update_sheets_f(
+            service=service,
+            spreadsheet_id=new_campaign_spreadsheet_id,
+            updates=[
+                (titles[target_resource], values)
+                for target_resource, values in processed_values.items()
+            ],
+        )
+    except HttpError as e:
+        raise _create_sheet_http_exception(e, titles=list(titles.values())) from e
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e)
+        ) from e
+
+    response = ""
+    for target_resource, values in processed_values.items():
+        response += f"Sheet with the name '{titles[target_resource]}' has been created successfully.\n"
+        if values.issues_present:
+            response += """But there are issues present in the data.
 Please check the 'Issues' column and correct the data accordingly.\n\n"""
 
     return response
@@ -592,28 +687,32 @@ async def process_spreadsheet(
             "new_campaign_sheet_title": new_campaign_sheet_title,
         }
     )
-    new_campaign_values = await get_sheet(
-        user_id=user_id,
-        spreadsheet_id=new_campaign_spreadsheet_id,
-        title=new_campaign_sheet_title,
-    )
-    try:
-        ads_template_values = await get_sheet(
+    # Both spreadsheets are read concurrently, the errors are raised in the
+    # same order as if they were read one after the other
+    new_campaign_values, template_sheets = await asyncio.gather(
+        get_sheet(
             user_id=user_id,
-            spreadsheet_id=template_spreadsheet_id,
-            title="Ads",
-        )
-        keywords_template_values = await get_sheet(
+            spreadsheet_id=new_campaign_spreadsheet_id,
+            title=new_campaign_sheet_title,
+        ),
+        _get_sheets(
             user_id=user_id,
-            spreadsheet_id=template_spreadsheet_id,
-            title="Keywords",
-        )
-        campaign_template_values = await get_sheet(
-            user_id=user_id, spreadsheet_id=template_spreadsheet_id, title="Campaigns"
-        )
-        ad_group_template_values = await get_sheet(
-            user_id=user_id, spreadsheet_id=template_spreadsheet_id, title="Ad Groups"
-        )
+            spreadsheet_id=template_spreadsheet_id,  # type: ignore[arg-type]
+            titles=["Ads", "Keywords", "Campaigns", "Ad Groups"],
+        ),
+        return_exceptions=True,
+    )
+    if isinstance(new_campaign_values, BaseException):
+        raise new_campaign_values
+    try:
+        if isinstance(template_sheets, BaseException):
+            raise template_sheets
+        (
+            ads_template_values,
+            keywords_template_values,
+            campaign_template_values,
+            ad_group_template_values,
+        ) = template_sheets
         if not isinstance(
             campaign_template_values, GoogleSheetValues
         ) or not isinstance(ad_group_template_values, GoogleSheetValues):
@@ -664,36 +763,28 @@ Please provide data in the correct format.""",
         )
 
     try:
-        processed_values = await process_campaign_data(
-            template_sheet_values=campaign_template_values,
-            new_campaign_sheet_values=new_campaign_values,
-        )
-
-        response = await _create_and_update_sheet(
-            user_id=user_id,
-            new_campaign_spreadsheet_id=new_campaign_spreadsheet_id,  # type: ignore[arg-type]
-            processed_values=processed_values,
-            target_resource="campaign",
-        )
-
+        processed_values = {
+            "campaign": await process_campaign_data(
+                template_sheet_values=campaign_template_values,
+                new_campaign_sheet_values=new_campaign_values,
+            )
+        }
         for template_values, target_resource in zip(
             [ads_template_values, keywords_template_values], ["ad", "keyword"]
         ):
-            processed_values = await process_data(
+            processed_values[target_resource] = await process_data(
                 template_sheet_values=template_values,
                 new_campaign_sheet_values=new_campaign_values,
                 merged_campaigns_ad_groups_df=merged_campaigns_ad_groups_df,
                 target_resource=target_resource,
             )
-
-            response += await _create_and_update_sheet(
-                user_id=user_id,
-                new_campaign_spreadsheet_id=new_campaign_spreadsheet_id,  # type: ignore[arg-type]
-                processed_values=processed_values,
-                target_resource=target_resource,
-            )
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e)
         ) from e
-    return response
+
+    return await _create_and_update_sheets(
+        user_id=user_id,
+        new_campaign_spreadsheet_id=new_campaign_spreadsheet_id,  # type: ignore[arg-type]
+        processed_values=processed_values,
+    )
@@ -1,5 +1,7 @@
-from typing import Any, Dict, List, Literal
+import re
+from typing import Any, Dict, Iterable, Iterator, List, Literal, Union, cast
 
+import numpy as np
 import pandas as pd
 
 __all__ = [
@@ -10,15 +12,25 @@ __all__ = [
 ]
 
 
+# Read-only rows are passed around as plain dicts instead of pd.Series
+Row = Dict[str, Any]
+
+
+def _iter_rows(df: pd.DataFrame) -> Iterator[Dict[str, Any]]:
+    columns = df.columns.tolist()
+    for values in df.itertuples(index=False, name=None):
+        yield dict(zip(columns, values))
+
+
 def validate_input_data(
     df: pd.DataFrame, mandatory_columns: List[str], name: str
 ) -> str:
     error_msg = ""
-    if len(df.columns) != len(set(df.columns)):
+    if df.columns.has_duplicates:
         error_msg = f"""Duplicate columns found in the {name} data.
 Please provide unique column names.
 """
-    if not all(col in df.columns for col in mandatory_columns):
+    if not set(mandatory_columns).issubset(df.columns):
         error_msg += f"""Mandatory columns missing in the {name} data.
 Please provide the following columns: {mandatory_columns}
 """
@@ -34,21 +46,39 @@ INSERT_CRITERION_TYPE = "{INSERT_CRITERION_TYPE}"
 INSERT_LANGUAGE_CODE = "{INSERT_LANGUAGE_CODE}"
 INSERT_CATEGORY = "{INSERT_CATEGORY}"
 INSERT_TICKET_PRICE = "{INSERT_TICKET_PRICE}"
+INSERT_TARGET_LOCATION = "{INSERT_TARGET_LOCATION}"
+
+CAMPAIGN_NAME_REGEX = re.compile(
+    "|".join(
+        re.escape(placeholder)
+        for placeholder in [
+            INSERT_COUNTRY,
+            INSERT_STATION_FROM,
+            INSERT_STATION_TO,
+            INSERT_CATEGORY,
+            INSERT_LANGUAGE_CODE,
+            INSERT_TARGET_LOCATION,
+        ]
+    )
+)
 
 
 def _update_campaign_name(
-    new_campaign_row: pd.Series,
+    new_campaign_row: Row,
     campaign_name: str,
     language_code: str,
     include_locations: str,
 ) -> str:
-    campaign_name = campaign_name.format(
-        INSERT_COUNTRY=new_campaign_row["Country"],
-        INSERT_STATION_FROM=new_campaign_row["Station From"],
-        INSERT_STATION_TO=new_campaign_row["Station To"],
-        INSERT_CATEGORY=new_campaign_row["Category"],
-        INSERT_LANGUAGE_CODE=language_code,
-        INSERT_TARGET_LOCATION=include_locations,
+    replacements = {
+        INSERT_COUNTRY: new_campaign_row["Country"],
+        INSERT_STATION_FROM: new_campaign_row["Station From"],
+        INSERT_STATION_TO: new_campaign_row["Station To"],
+        INSERT_CATEGORY: new_campaign_row["Category"],
+        INSERT_LANGUAGE_CODE: language_code,
+        INSERT_TARGET_LOCATION: include_locations,
+    }
+    campaign_name = CAMPAIGN_NAME_REGEX.sub(
+        lambda match: str(replacements[match.group(0)]), campaign_name
     )
     return campaign_name
 
@@ -78,41 +108,32 @@ COPY_ALL_WITH_PREFIX = [
 ]
 
 
-def _copy_all_with_prefixes(
-    new_campaign_row: pd.Series,
-    new_row: pd.Series,
-    prefixes: List[str] = COPY_ALL_WITH_PREFIX,
-) -> pd.Series:
-    for prefix in prefixes:
-        columns = [col for col in new_campaign_row.index if col.startswith(prefix)]
-        for col in columns:
-            new_row[col] = new_campaign_row[col]
-    return new_row
-
-
-def _get_target_location(new_campaign_row: pd.Series) -> str:
+def _get_target_locations(new_campaign_df: pd.DataFrame) -> pd.Series:
     include_locations_columns = [
-        col for col in new_campaign_row.index if col.startswith("Include Location")
-    ]
-    include_locations_values = [
-        new_campaign_row[col]
-        for col in include_locations_columns
-        if new_campaign_row[col]
+        col for col in new_campaign_df.columns if col.startswith("Include Location")
     ]
-    if include_locations_values:
-        include_locations = "-".join(include_locations_values)
-    else:
-        include_locations = "Worldwide"
-    return include_locations
+    # Positional index, so the result lines up with the rows of new_campaign_df
+    locations = new_campaign_df[include_locations_columns].reset_index(drop=True)
+    include_locations = cast(
+        "pd.Series[str]",
+        locations.where(locations.astype(bool))
+        .stack()
+        .groupby(level=0, sort=False)
+        .agg("-".join),
+    )
+    return include_locations.reindex(
+        range(len(new_campaign_df)), fill_value="Worldwide"
+    )
 
 
 def process_campaign_data_f(
     campaigns_template_df: pd.DataFrame, new_campaign_df: pd.DataFrame
 ) -> pd.DataFrame:
     new_campaign_df["Language Code"] = new_campaign_df["Language Code"].str.upper()
-    campaigns_template_df["Language Code"] = campaigns_template_df[
-        "Language Code"
-    ].str.upper()
+    # Low-cardinality column used for filtering in the loop below
+    campaigns_template_df["Language Code"] = (
+        campaigns_template_df["Language Code"].str.upper().astype("category")
+    )
 
     _validate_language_codes(
         new_campaign_df,
@@ -120,67 +141,129 @@ def process_campaign_data_f(
         table_name="Campaigns",
     )
 
-    final_df = None
-    # columns are campaign_template_df.columns + columns which start with COPY_ALL_WITH_PREFIX
-    columns = list(campaigns_template_df.columns) + [
+    copy_columns = [
         col
         for col in new_campaign_df.columns
         if any(col.startswith(prefix) for prefix in COPY_ALL_WITH_PREFIX)
     ]
-    for _, new_campaign_row in new_campaign_df.iterrows():
-        for _, template_row in campaigns_template_df[
-            campaigns_template_df["Language Code"] == new_campaign_row["Language Code"]
-        ].iterrows():
-            new_row = template_row.copy()
-            new_row = _copy_all_with_prefixes(new_campaign_row, new_row)
-            include_locations = _get_target_location(new_campaign_row)
-
-            new_row["Campaign Name"] = _update_campaign_name(
-                new_campaign_row,
-                campaign_name=new_row["Campaign Name"],
-                language_code=new_row["Language Code"],
-                include_locations=include_locations,
-            )
 
-            if final_df is None:
-                final_df = pd.DataFrame([new_row], columns=columns)
-            else:
-                final_df = pd.concat(
-                    [final_df, pd.DataFrame([new_row], columns=columns)],
-                    ignore_index=True,
-                )
+    # Every new campaign row is paired with all template rows with the same
+    # language code, keeping the order of the new campaign rows
+    # Both sides share the template categories, so the join runs on the codes
+    language_codes = campaigns_template_df["Language Code"].dtype
+    pairs = pd.merge(
+        pd.DataFrame(
+            {
+                "new": range(len(new_campaign_df)),
+                "Language Code": new_campaign_df["Language Code"].astype(
+                    language_codes
+                ),
+            }
+        ),
+        pd.DataFrame(
+            {
+                "template": range(len(campaigns_template_df)),
+                "Language Code": campaigns_template_df["Language Code"],
+            }
+        ),
+        on="Language Code",
+    ).sort_values(by=["new", "template"], ignore_index=True)
+
+    template_part = campaigns_template_df.iloc[pairs["template"]].reset_index(drop=True)
+    new_part = new_campaign_df.iloc[pairs["new"]][copy_columns].reset_index(drop=True)
+    # Values from the new campaign take precedence over the template ones
+    overridden_columns = [col for col in copy_columns if col in template_part]
+    template_part[overridden_columns] = new_part[overridden_columns]
+    # columns are campaign_template_df.columns + columns which start with COPY_ALL_WITH_PREFIX
+    final_df = pd.concat([template_part, new_part], axis=1)
+
+    new_campaign_rows = list(_iter_rows(new_campaign_df))
+    include_locations = _get_target_locations(new_campaign_df).tolist()
+    final_df["Campaign Name"] = [
+        _update_campaign_name(
+            new_campaign_rows[i],
+            campaign_name=campaign_name,
+            language_code=language_code,
+            include_locations=include_locations[i],
+        )
+        for i, campaign_name, language_code in zip(
+            pairs["new"], template_part["Campaign Name"], pairs["Language Code"]
+        )
+    ]
 
-            final_df["Search Network"] = final_df["Search Network"].astype(bool)
-            final_df["Google Search Network"] = final_df[
-                "Google Search Network"
-            ].astype(bool)
-            final_df["Default max. CPC"] = final_df["Default max. CPC"].astype(float)
+    final_df = final_df.infer_objects().astype(
+        {
+            "Language Code": object,
+            "Search Network": bool,
+            "Google Search Network": bool,
+            "Default max. CPC": float,
+        }
+    )
 
     return final_df
 
 
+REPLACE_VALUES_REGEX = re.compile(
+    "|".join(
+        re.escape(placeholder)
+        for placeholder in [
+            INSERT_COUNTRY,
+            INSERT_STATION_FROM,
+            INSERT_STATION_TO,
+            INSERT_CRITERION_TYPE,
+            INSERT_TICKET_PRICE,
+        ]
+    )
+)
+TICKET_PRICE_LINE_REGEX = re.compile(".*" + re.escape(INSERT_TICKET_PRICE) + ".*")
+
+
 def _replace_values(
-    new_campaign_row: pd.Series, new_row: pd.Series, station: Dict[str, Any]
+    new_campaign_row: Row, new_row: pd.Series, station: Dict[str, Any]
 ) -> pd.Series:
-    new_row = new_row.str.replace(INSERT_COUNTRY, new_campaign_row["Country"])
-    new_row = new_row.str.replace(INSERT_STATION_FROM, station["Station From"])
-    new_row = new_row.str.replace(INSERT_STATION_TO, station["Station To"])
-    new_row = new_row.str.replace(INSERT_CRITERION_TYPE, new_row["Match Type"])
+    replacements: Dict[str, str] = {
+        INSERT_COUNTRY: new_campaign_row["Country"],
+        INSERT_STATION_FROM: station["Station From"],
+        INSERT_STATION_TO: station["Station To"],
+    }
+
+    def _replace(match: re.Match[str]) -> str:
+        placeholder = match.group(0)
+        return replacements.get(placeholder, placeholder)
+
+    # {INSERT_CRITERION_TYPE} is replaced with the already substituted Match Type
+    replacements[INSERT_CRITERION_TYPE] = REPLACE_VALUES_REGEX.sub(
+        _replace, new_row["Match Type"]
+    )
     if new_campaign_row["Ticket Price"]:
-        new_row = new_row.str.replace(
-            INSERT_TICKET_PRICE, new_campaign_row["Ticket Price"]
-        )
-    else:
+        replacements[INSERT_TICKET_PRICE] = new_campaign_row["Ticket Price"]
+
+    # All placeholders are substituted in a single scan of each string cell,
+    # non-string cells follow the Series.str semantics
+    values = [
+        REPLACE_VALUES_REGEX.sub(_replace, value)
+        if isinstance(value, str)
+        else (value if pd.isna(value) else np.nan)
+        for value in new_row.to_numpy(dtype=object)
+    ]
+    if not new_campaign_row["Ticket Price"]:
         # Locate all the columns with the string "{INSERT_TICKET_PRICE}"
         # and replace them WHOLE column with an empty string (not only the string)
-        new_row = new_row.str.replace(r".*{INSERT_TICKET_PRICE}.*", "", regex=True)
-    return new_row
+        values = [
+            TICKET_PRICE_LINE_REGEX.sub("", value) if isinstance(value, str) else value
+            for value in values
+        ]
+    return pd.Series(values, index=new_row.index, name=new_row.name, dtype=object)
 
 
-def _replace_headline_values(new_row: pd.Series, station: Dict[str, Any]) -> pd.Series:
+def _get_headline_columns(columns: Iterable[str]) -> List[str]:
     # Filter columns that start with "Headline"
-    headline_columns = [col for col in new_row.index if col.startswith("Headline")]
+    return [col for col in columns if col.startswith("Headline")]
+
 
+def _replace_headline_values(
+    new_row: pd.Series, station: Dict[str, Any], headline_columns: List[str]
+) -> pd.Series:
     # Perform replacements only in the headline columns
     for col in headline_columns:
         new_row[col] = (
@@ -194,19 +277,21 @@ def _replace_headline_values(new_row: pd.Series, station: Dict[str, Any]) -> pd.
 USE_ORIGINAL_STATION_FROM = ["transfer", "taxi"]
 
 
+def _filter_keyword_template(template_df: pd.DataFrame) -> pd.DataFrame:
+    # Positive keywords (Keyword Match Type) should be the same as Match Type (which is used as a part of Ad Group Name)
+    # Evaluated once for the whole template instead of for every new campaign row
+    is_positive = template_df["Negative"].str.lower() == "false"
+    same_match_type = template_df["Keyword Match Type"] == template_df["Match Type"]
+    return template_df[~is_positive | same_match_type]
+
+
 def _process_row(
-    new_campaign_row: pd.Series,
+    new_campaign_row: Row,
     template_row: pd.Series,
-    final_df: pd.DataFrame,
+    include_locations: str,
     target_resource: str,
-) -> pd.DataFrame:
-    # Positive keywords (Keyword Match Type) should be the same as Match Type (which is used as a part of Ad Group Name)
-    if target_resource == "keyword" and (
-        template_row["Negative"].lower() == "false"
-        and template_row["Keyword Match Type"] != template_row["Match Type"]
-    ):
-        return final_df
-
+    headline_columns: List[str],
+) -> List[Dict[str, Any]]:
     stations = [
         {
             "Station From": new_campaign_row["Station From"],
@@ -222,9 +307,9 @@ def _process_row(
         stations[0]["Final Url"] = new_campaign_row["Final Url From"]
         stations[1]["Final Url"] = new_campaign_row["Final Url To"]
 
+    rows = []
     for station in stations:
         new_row = template_row.copy()
-        include_locations = _get_target_location(new_campaign_row)
         new_row["Campaign Name"] = _update_campaign_name(
             new_campaign_row,
             campaign_name=new_row["Campaign Name"],
@@ -233,7 +318,7 @@ def _process_row(
         )
         if new_row["Category"] in USE_ORIGINAL_STATION_FROM:
             # Use the original Station From in headlines for both directions
-            new_row = _replace_headline_values(new_row, stations[0])
+            new_row = _replace_headline_values(new_row, stations[0], headline_columns)
 
         new_row = _replace_values(new_campaign_row, new_row, station)
 
@@ -254,12 +339,18 @@ def _process_row(
                     new_row["Keyword"].replace(INSERT_CATEGORY, "").strip()
                 )
 
-        new_row = new_row.str.replace(INSERT_CATEGORY, new_row["Real Category"])
+        # Plain str.replace per cell, the row is turned into a dict anyway
+        real_category = str(new_row["Real Category"])
+        rows.append(
+            {
+                str(col): value.replace(INSERT_CATEGORY, real_category)
+                if isinstance(value, str)
+                else value
+                for col, value in new_row.items()
+            }
+        )
 
-        final_df = pd.concat([final_df, pd.DataFrame([new_row])], ignore_index=True)
-
-    final_df = final_df.drop_duplicates(ignore_index=True)
-    return final_df
+    return rows
 
 
 def process_data_f(
@@ -274,9 +365,20 @@ def process_data_f(
     template_df["Language Code"] = template_df["Language Code"].str.upper()
     new_campaign_df["Language Code"] = new_campaign_df["Language Code"].str.upper()
     on = ["Language Code", "Match Type"] if target_resource == "ad" else "Language Code"
+    # Both sides share the same categories, so the join runs on the codes
+    language_codes = pd.CategoricalDtype(
+        pd.concat(
+            [
+                merged_campaigns_ad_groups_df["Language Code"],
+                template_df["Language Code"],
+            ]
+        )
+        .dropna()
+        .unique()
+    )
     template_df = pd.merge(
-        merged_campaigns_ad_groups_df,
-        template_df,
+        merged_campaigns_ad_groups_df.astype({"Language Code": language_codes}),
+        template_df.astype({"Language Code": language_codes}),
         how="inner",
         on=on,
     )
@@ -290,33 +392,59 @@ def process_data_f(
         )
     ]
 
+    # Low-cardinality column used for filtering in the loop below
+    template_df = template_df.astype({"Ad Group Category": "category"})
+
     _validate_language_codes(
         new_campaign_df,
         valid_language_codes=template_df["Language Code"].unique(),
         table_name=target_resource,
     )
 
-    final_df = pd.DataFrame(columns=template_df.columns)
-    for _, new_campaign_row in new_campaign_df.iterrows():
+    if target_resource == "keyword":
+        template_df = _filter_keyword_template(template_df)
+
+    # Identical input rows would only produce rows removed by drop_duplicates below
+    template_df = template_df.drop_duplicates()
+    new_campaign_df = new_campaign_df.drop_duplicates()
+
+    rows: List[Dict[str, Any]] = []
+    # Column lookups are done once for all rows
+    target_locations = _get_target_locations(new_campaign_df).tolist()
+    headline_columns = _get_headline_columns(template_df.columns)
+    for new_campaign_row, include_locations in zip(
+        _iter_rows(new_campaign_df), target_locations
+    ):
         for _, template_row in template_df[
             (template_df["Language Code"] == new_campaign_row["Language Code"])
             & (template_df["Ad Group Category"] == new_campaign_row["Category"])
         ].iterrows():
-            final_df = _process_row(
-                new_campaign_row, template_row, final_df, target_resource
+            rows += _process_row(
+                new_campaign_row,
+                template_row,
+                include_locations,
+                target_resource,
+                headline_columns,
             )
 
-    final_df = final_df.drop(
-        columns=[
-            "Language Code",
-            "Category",
-            "Target Category",
-            "Ad Group Category",
-            "Real Category",
-        ]
+    # Build the DataFrame once instead of concatenating row by row. All rows
+    # share the keys of the first one, so the columns don't have to be inferred
+    final_df = pd.DataFrame.from_records(
+        rows, columns=list(rows[0]) if rows else template_df.columns
     )
+
+    drop_columns = [
+        "Language Code",
+        "Category",
+        "Target Category",
+        "Ad Group Category",
+        "Real Category",
+    ]
     if target_resource == "keyword":
-        final_df = final_df.drop(columns=["Keyword Match Type"])
+        drop_columns.append("Keyword Match Type")
+    final_df = final_df.drop(columns=drop_columns)
+    # Still needed for rows which only become identical after the substitutions,
+    # e.g. campaign level negative keywords are the same for both directions
     final_df = final_df.drop_duplicates(ignore_index=True)
 
     final_df = final_df.sort_values(
@@ -337,71 +465,98 @@ MAX_DESCRIPTION_LENGTH = 90
 MAX_PATH_LENGTH = 15
 
 
-def _validate_output_data_ad(df: pd.DataFrame) -> pd.DataFrame:  # noqa: C901
+def _issues_where(condition: pd.Series, message: Union[str, pd.Series]) -> pd.Series:
+    return pd.Series(np.where(condition, message, ""), index=condition.index)
+
+
+def _validate_output_data_ad(df: pd.DataFrame) -> pd.DataFrame:
+    # Nothing to check, and the columns read below may not even be present
+    if df.empty:
+        return df
+
     df.insert(0, "Issues", "")
 
     headline_columns = [col for col in df.columns if "Headline" in col]
     description_columns = [col for col in df.columns if "Description" in col]
 
-    for index, row in df.iterrows():
-        headlines = [headline for headline in row[headline_columns] if headline]
-        descriptions = [
-            description for description in row[description_columns] if description
-        ]
-        if len(set(headlines)) != len(headlines):
-            df.loc[index, "Issues"] += "Duplicate headlines found.\n"
-        if len(set(descriptions)) != len(descriptions):
-            df.loc[index, "Issues"] += "Duplicate descriptions found.\n"
-
-        # Check for the number of headlines and descriptions
-        headline_count = len(
-            [headline for headline in row[headline_columns] if headline]
-        )
-        if headline_count < MIN_HEADLINES:
-            df.loc[index, "Issues"] += (
-                f"Minimum {MIN_HEADLINES} headlines are required, found {headline_count}.\n"
-            )
-        elif headline_count > MAX_HEADLINES:
-            df.loc[index, "Issues"] += (
-                f"Maximum {MAX_HEADLINES} headlines are allowed, found {headline_count}.\n"
-            )
+    # All checks are evaluated column-wise for all rows at once and the
+    # messages are concatenated in the same order as they are listed below
+    headlines = df[headline_columns]
+    descriptions = df[description_columns]
+    # The lengths are computed once and reused for the count and length checks
+    headline_lengths = headlines.apply(lambda column: column.map(len))
+    description_lengths = descriptions.apply(lambda column: column.map(len))
+    headline_present = headline_lengths > 0
+    description_present = description_lengths > 0
+    headline_count = headline_present.sum(axis=1)
+    description_count = description_present.sum(axis=1)
+
+    issues = _issues_where(
+        headlines.where(headline_present).nunique(axis=1) != headline_count,
+        "Duplicate headlines found.\n",
+    )
+    issues += _issues_where(
+        descriptions.where(description_present).nunique(axis=1) != description_count,
+        "Duplicate descriptions found.\n",
+    )
 
-        description_count = len(
-            [description for description in row[description_columns] if description]
-        )
-        if description_count < MIN_DESCRIPTIONS:
-            df.loc[index, "Issues"] += (
-                f"Minimum {MIN_DESCRIPTIONS} descriptions are required, found {description_count}.\n"
-            )
-        elif description_count > MAX_DESCRIPTIONS:
-            df.loc[index, "Issues"] += (
-                f"Maximum {MAX_DESCRIPTIONS} descriptions are allowed, found {description_count}.\n"
-            )
+    # Check for the number of headlines and descriptions
+    issues += _issues_where(
+        headline_count < MIN_HEADLINES,
+        f"Minimum {MIN_HEADLINES} headlines are required, found "
+        + headline_count.astype(str)
+        + ".\n",
+    )
+    issues += _issues_where(
+        headline_count > MAX_HEADLINES,
+        f"Maximum {MAX_HEADLINES} headlines are allowed, found "
+        + headline_count.astype(str)
+        + ".\n",
+    )
+    issues += _issues_where(
+        description_count < MIN_DESCRIPTIONS,
+        f"Minimum {MIN_DESCRIPTIONS} descriptions are required, found "
+        + description_count.astype(str)
+        + ".\n",
+    )
+    issues += _issues_where(
+        description_count > MAX_DESCRIPTIONS,
+        f"Maximum {MAX_DESCRIPTIONS} descriptions are allowed, found "
+        + description_count.astype(str)
+        + ".\n",
+    )
 
-        # Check for the length of headlines and descriptions
-        for headline_column in headline_columns:
-            headline = row[headline_column]
-            if len(headline) > MAX_HEADLINE_LENGTH:
-                df.loc[index, "Issues"] += (
-                    f"Headline length should be less than {MAX_HEADLINE_LENGTH} characters, found {len(headline)} in column {headline_column}.\n"
-                )
+    # Check for the length of headlines and descriptions
+    for headline_column in headline_columns:
+        length = headline_lengths[headline_column]
+        issues += _issues_where(
+            length > MAX_HEADLINE_LENGTH,
+            f"Headline length should be less than {MAX_HEADLINE_LENGTH} characters, found "
+            + length.astype(str)
+            + f" in column {headline_column}.\n",
+        )
 
-        for description_column in description_columns:
-            description = row[description_column]
-            if len(description) > MAX_DESCRIPTION_LENGTH:
-                df.loc[index, "Issues"] += (
-                    f"Description length should be less than {MAX_DESCRIPTION_LENGTH} characters, found {len(description)} in column {description_column}.\n"
-                )
+    for description_column in description_columns:
+        length = description_lengths[description_column]
+        issues += _issues_where(
+            length > MAX_DESCRIPTION_LENGTH,
+            f"Description length should be less than {MAX_DESCRIPTION_LENGTH} characters, found "
+            + length.astype(str)
+            + f" in column {description_column}.\n",
+        )
 
-        for path in ["Path 1", "Path 2"]:
-            if row[path] and len(row[path]) > MAX_PATH_LENGTH:
-                df.loc[index, "Issues"] += (
-                    f"{path} length should be less than {MAX_PATH_LENGTH} characters, found {len(row[path])}.\n"
-                )
+    for path in ["Path 1", "Path 2"]:
+        length = df[path].map(lambda value: len(value) if value else 0)
+        issues += _issues_where(
+            length > MAX_PATH_LENGTH,
+            f"{path} length should be less than {MAX_PATH_LENGTH} characters, found "
+            + length.astype(str)
+            + ".\n",
+        )
 
-        if not row["Final URL"]:
-            df.loc[index, "Issues"] += "Final URL is missing.\n"
+    issues += _issues_where(~df["Final URL"].astype(bool), "Final URL is missing.\n")
 
+    df["Issues"] = issues
     if not df["Issues"].any():
         df = df.drop(columns=["Issues"])
 
@@ -419,7 +574,10 @@ def _validate_output_data_campaign(df: pd.DataFrame) -> pd.DataFrame:
         col for col in df.columns if col.startswith("Sitelink") and col.endswith("Text")
     ]
 
-    for index, row in df.iterrows():
+    # Issues are collected per row and assigned to the column once
+    issues = []
+    for row in _iter_rows(df):
+        row_issues = []
         for site_text_column in sitelink_text_columns:
             site_text = row[site_text_column]
             if not site_text:
@@ -440,9 +598,10 @@ def _validate_output_data_campaign(df: pd.DataFrame) -> pd.DataFrame:
                 ):
                     error_msg += f"Sitelink description length should be less than {MAX_SITELINK_DESCRIPTION_LENGTH} characters, found {len(site_description)} in column {site_description_column} {i}.\n"
 
-            if error_msg:
-                df.loc[index, "Issues"] += error_msg
+            row_issues.append(error_msg)
+        issues.append("".join(row_issues))
 
+    df["Issues"] = issues
     if not df["Issues"].any():
         df = df.drop(columns=["Issues"])
 
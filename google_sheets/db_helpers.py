@@ -1,14 +1,63 @@
-from contextlib import asynccontextmanager
+import asyncio
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
 from os import environ
-from typing import AsyncGenerator, Optional
+from typing import AsyncGenerator, AsyncIterator, Dict, Iterator, Optional
 
 from prisma import Prisma  # type: ignore[attr-defined]
 
 
+@dataclass
+class DBClients:
+    # Connected Prisma clients, one per database URL. Must be created inside
+    # the event loop the clients are used from.
+    _clients: Dict[str, Prisma] = field(default_factory=dict)
+    _lock: asyncio.Lock = field(default_factory=asyncio.Lock)
+
+    async def get(self, db_url: str) -> Prisma:
+        db = self._clients.get(db_url)
+        if db is None:
+            async with self._lock:
+                db = self._clients.get(db_url)
+                if db is None:
+                    db = Prisma(datasource={"url": db_url})
+                    await db.connect()
+                    self._clients[db_url] = db
+        return db
+
+    async def disconnect(self) -> None:
+        while self._clients:
+            _, db = self._clients.popitem()
+            await db.disconnect()
+
+
+# Clients shared by get_db_connection in the context they were activated in
+_active_db_clients: ContextVar[Optional[DBClients]] = ContextVar(
+    "_active_db_clients", default=None
+)
+
+
+@contextmanager
+def use_db_clients(clients: DBClients) -> Iterator[None]:
+    token = _active_db_clients.set(clients)
+    try:
+        yield
+    finally:
+        _active_db_clients.reset(token)
+
+
 @asynccontextmanager
-async def get_db_connection(
-    db_url: Optional[str] = None,
-) -> AsyncGenerator[Prisma, None]:
+async def db_clients() -> AsyncIterator[DBClients]:
+    clients = DBClients()
+    try:
+        with use_db_clients(clients):
+            yield clients
+    finally:
+        await clients.disconnect()
+
+
+def _get_db_url(db_url: Optional[str] = None) -> str:
     if not db_url:
         db_url = environ.get("DATABASE_URL", None)
         if not db_url:
@@ -17,6 +66,19 @@ async def get_db_connection(
             )  # pragma: no cover
     if "connect_timeout" not in db_url:
         db_url += "?connect_timeout=60"
+    return db_url
+
+
+@asynccontextmanager
+async def get_db_connection(
+    db_url: Optional[str] = None,
+) -> AsyncGenerator[Prisma, None]:
+    db_url = _get_db_url(db_url)
+    clients = _active_db_clients.get()
+    if clients is not None:
+        yield await clients.get(db_url)
+        return
+
     db = Prisma(datasource={"url": db_url})
     await db.connect()
     try:
@@ -4,22 +4,34 @@ from .oauth_settings import (
     oauth2_settings,
 )
 from .service import (
+    ValueRenderOption,
+    batch_get_sheets_f,
+    batch_update_sheets_f,
     build_service,
     create_sheet_f,
+    create_sheets_f,
     get_all_sheet_titles_f,
     get_files_f,
     get_sheet_f,
+    invalidate_user_credentials,
+    refresh_expiring_credentials,
     update_sheet_f,
 )
 
 __all__ = [
+    "ValueRenderOption",
+    "batch_get_sheets_f",
+    "batch_update_sheets_f",
     "build_service",
     "create_sheet_f",
+    "create_sheets_f",
     "get_all_sheet_titles_f",
     "get_files_f",
     "get_google_oauth_url",
     "get_sheet_f",
     "get_token_request_data",
+    "invalidate_user_credentials",
     "oauth2_settings",
+    "refresh_expiring_credentials",
     "update_sheet_f",
 ]
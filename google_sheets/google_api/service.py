@@ -1,9 +1,35 @@
-from typing import Any, Dict, List, Union
+import asyncio
+import copy
+import random
+import socket
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache, partial, wraps
+from os import environ
+from time import monotonic, sleep
+from typing import (
+    Any,
+    Awaitable,
+    Callable,
+    Dict,
+    List,
+    Literal,
+    Optional,
+    Tuple,
+    TypeVar,
+    Union,
+)
+from weakref import WeakKeyDictionary, WeakValueDictionary
 
-from asyncify import asyncify
 from fastapi import HTTPException
+from google.auth.exceptions import RefreshError
 from google.oauth2.credentials import Credentials
-from googleapiclient.discovery import build
+from google_auth_httplib2 import AuthorizedHttp, Request
+from googleapiclient import discovery_cache
+from googleapiclient.discovery import build_from_document
+from googleapiclient.errors import HttpError
+from googleapiclient.http import build_http
 from prisma.errors import RecordNotFoundError
 
 from ..db_helpers import get_db_connection
@@ -11,14 +37,168 @@ from ..model import GoogleSheetValues
 from .oauth_settings import oauth2_settings
 
 __all__ = [
+    "ValueRenderOption",
+    "batch_get_sheets_f",
+    "batch_update_sheets_f",
     "build_service",
     "create_sheet_f",
+    "create_sheets_f",
     "get_all_sheet_titles_f",
     "get_files_f",
     "get_sheet_f",
+    "invalidate_user_credentials",
+    "refresh_expiring_credentials",
     "update_sheet_f",
 ]
 
+T = TypeVar("T")
+
+# The data processing expects the cells as they are shown in the sheet, so
+# FORMATTED_VALUE is the default. The unformatted values are smaller and
+# cheaper to render for callers which work with the raw numbers.
+ValueRenderOption = Literal["FORMATTED_VALUE", "UNFORMATTED_VALUE", "FORMULA"]
+
+# Rate limited and server error responses are retried with randomized
+# exponential backoff, or after the delay asked for in the Retry-After header.
+# Requests adding sheets are not retried, the failed attempt may have added
+# them already. The retries of one request wait at most RETRY_BUDGET_SECONDS
+# in total, since they hold a worker thread and the user's semaphore.
+NUM_RETRIES = 5
+RETRY_BUDGET_SECONDS = 60
+_RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+_RATE_LIMIT_REASONS = {"rateLimitExceeded", "userRateLimitExceeded"}
+
+
+def _should_retry(e: HttpError) -> bool:
+    if e.resp.status in _RETRY_STATUS_CODES:
+        return True
+    # Quota errors of the Google APIs come as 403 with the reason in the body
+    return e.resp.status == 403 and any(
+        isinstance(detail, dict) and detail.get("reason") in _RATE_LIMIT_REASONS
+        for detail in (e.error_details or [])
+    )
+
+
+def _execute(request: Any) -> Any:
+    attempt = 0
+    waited = 0.0
+    while True:
+        try:
+            return request.execute()
+        except HttpError as e:
+            if not _should_retry(e):
+                raise
+            error: Exception = e
+            retry_after = e.resp.get("retry-after", "")
+            if retry_after.isdigit():
+                delay = float(retry_after)
+            else:
+                delay = random.random() * 2**attempt
+        # socket.timeout is not a TimeoutError before Python 3.10
+        except (ConnectionError, TimeoutError, socket.timeout) as e:
+            error = e
+            delay = random.random() * 2**attempt
+        if attempt == NUM_RETRIES or waited + delay > RETRY_BUDGET_SECONDS:
+            raise error
+        sleep(delay)
+        waited += delay
+        attempt += 1
+
+
+def _positive_int_from_env(name: str, default: int) -> int:
+    value = int(environ.get(name, default))
+    if value < 1:
+        raise ValueError(f"'{name}' must be at least 1, got {value}")
+    return value
+
+
+# The Google API client is blocking, all calls share one bounded thread pool
+GOOGLE_API_MAX_WORKERS = _positive_int_from_env("GOOGLE_API_MAX_WORKERS", 32)
+_executor = ThreadPoolExecutor(
+    max_workers=GOOGLE_API_MAX_WORKERS, thread_name_prefix="google-api"
+)
+
+
+# Calls of the same user are limited, so that a burst of requests doesn't run
+# into the per-user quota of the Google APIs. The semaphores are looked up by
+# the service, which is built for a single user in build_service.
+MAX_CONCURRENT_CALLS_PER_USER = _positive_int_from_env(
+    "GOOGLE_API_MAX_CONCURRENT_CALLS_PER_USER", 10
+)
+_user_semaphores: "WeakValueDictionary[Union[int, str], asyncio.Semaphore]" = (
+    WeakValueDictionary()
+)
+_service_semaphores: "WeakKeyDictionary[Any, asyncio.Semaphore]" = WeakKeyDictionary()
+_service_users: "WeakKeyDictionary[Any, Union[int, str]]" = WeakKeyDictionary()
+
+
+def _get_user_semaphore(user_id: Union[int, str]) -> asyncio.Semaphore:
+    semaphore = _user_semaphores.get(user_id)
+    if semaphore is None:
+        semaphore = _user_semaphores[user_id] = asyncio.Semaphore(
+            MAX_CONCURRENT_CALLS_PER_USER
+        )
+    return semaphore
+
+
+def _is_auth_error(e: Optional[BaseException]) -> bool:
+    return isinstance(e, RefreshError) or (
+        isinstance(e, HttpError) and e.resp.status == 401
+    )
+
+
+def _run_in_executor(func: Callable[..., T]) -> Callable[..., Awaitable[T]]:
+    @wraps(func)
+    async def wrapper(*args: Any, **kwargs: Any) -> T:
+        loop = asyncio.get_running_loop()
+        call = partial(func, *args, **kwargs)
+        service = kwargs["service"] if "service" in kwargs else args[0]
+        semaphore = _service_semaphores.get(service)
+        try:
+            if semaphore is None:
+                return await loop.run_in_executor(_executor, call)
+            async with semaphore:
+                return await loop.run_in_executor(_executor, call)
+        except Exception as e:
+            # The cached credentials were revoked or replaced by a new login,
+            # possibly one handled by another worker process. They are loaded
+            # from the database again on the next request.
+            user_id = _service_users.get(service)
+            if user_id is not None and (
+                _is_auth_error(e) or _is_auth_error(e.__cause__)
+            ):
+                invalidate_user_credentials(user_id)
+            raise
+
+    return wrapper
+
+
+class _ThreadLocalHttp:
+    # httplib2.Http is not thread-safe, so every worker thread keeps its own
+    # one. Its connections stay open and are reused by the following requests.
+    _local = threading.local()
+
+    def _http(self) -> Any:
+        http = getattr(self._local, "http", None)
+        if http is None:
+            http = self._local.http = build_http()
+        return http
+
+    def request(self, *args: Any, **kwargs: Any) -> Any:
+        return self._http().request(*args, **kwargs)
+
+    def close(self) -> None:
+        # Closes the connections of the current thread only, the next request
+        # from it opens new ones
+        http = getattr(self._local, "http", None)
+        if http is not None:
+            del self._local.http
+            http.close()
+
+    def __getattr__(self, name: str) -> Any:
+        # timeout, redirect_codes, connections, ... of the thread's Http
+        return getattr(self._http(), name)
+
 
 async def _load_user_credentials(user_id: Union[int, str]) -> Any:
     async with get_db_connection() as db:
@@ -32,47 +212,213 @@ async def _load_user_credentials(user_id: Union[int, str]) -> Any:
     return data.creds
 
 
-async def build_service(user_id: int, service_name: str, version: str) -> Any:
+# Credentials are reused for a while, so that consecutive requests of the same
+# user neither query the database nor refresh the access token again
+CREDENTIALS_TTL_SECONDS = 10 * 60
+_credentials_cache: Dict[Union[int, str], Tuple[float, Credentials]] = {}
+
+# Access tokens expiring sooner than this are refreshed in the background,
+# before requests would have to wait for the refresh
+TOKEN_REFRESH_MARGIN = timedelta(minutes=5)
+TOKEN_REFRESH_INTERVAL_SECONDS = 60
+_token_refreshes: Dict[Union[int, str], "asyncio.Future[Credentials]"] = {}
+
+
+def invalidate_user_credentials(user_id: Union[int, str]) -> None:
+    _credentials_cache.pop(user_id, None)
+    # A refresh still running is for the dropped credentials
+    _token_refreshes.pop(user_id, None)
+
+
+def _expires_soon(creds: Credentials) -> bool:
+    if creds.expiry is None:
+        return False
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    return creds.expiry - now < TOKEN_REFRESH_MARGIN  # type: ignore[no-any-return]
+
+
+def _refresh_copy(creds: Credentials) -> Credentials:
+    # The cached credentials are used by the requests running at the same time,
+    # so a copy is refreshed and swapped in once it has the new token
+    refreshed = copy.copy(creds)
+    refreshed.refresh(Request(build_http()))  # type: ignore[no-untyped-call]
+    return refreshed
+
+
+def _refresh_credentials(
+    user_id: Union[int, str], creds: Credentials
+) -> "asyncio.Future[Credentials]":
+    future = _token_refreshes.get(user_id)
+    if future is not None:
+        return future
+
+    def _on_done(future: "asyncio.Future[Credentials]") -> None:
+        if _token_refreshes.get(user_id) is future:
+            del _token_refreshes[user_id]
+        cached = _credentials_cache.get(user_id)
+        if future.cancelled() or cached is None or cached[1] is not creds:
+            return
+        if future.exception() is not None:
+            # The next request loads the credentials again
+            invalidate_user_credentials(user_id)
+        else:
+            _credentials_cache[user_id] = (cached[0], future.result())
+
+    loop = asyncio.get_running_loop()
+    future = loop.run_in_executor(_executor, _refresh_copy, creds)
+    future.add_done_callback(_on_done)
+    _token_refreshes[user_id] = future
+    return future
+
+
+def _refresh_expiring_credentials() -> None:
+    now = monotonic()
+    for user_id, (loaded_at, creds) in list(_credentials_cache.items()):
+        if now - loaded_at >= CREDENTIALS_TTL_SECONDS:
+            # Loaded again on the next request anyway, dropped so that users who
+            # do not come back are not kept in memory
+            _credentials_cache.pop(user_id, None)
+        elif _expires_soon(creds):
+            _refresh_credentials(user_id, creds)
+
+
+async def refresh_expiring_credentials() -> None:
+    while True:
+        await asyncio.sleep(TOKEN_REFRESH_INTERVAL_SECONDS)
+        _refresh_expiring_credentials()
+
+
+async def _get_user_credentials(user_id: Union[int, str]) -> Credentials:
+    cached = _credentials_cache.get(user_id)
+    if cached is not None and monotonic() - cached[0] < CREDENTIALS_TTL_SECONDS:
+        creds = cached[1]
+    else:
+        creds = await _load_credentials(user_id, cached[1] if cached else None)
+        _credentials_cache[user_id] = (monotonic(), creds)
+
+    if not creds.valid:
+        # Otherwise every request would refresh the shared credentials in its
+        # own worker thread. The refresh is shielded since other requests may
+        # be waiting for it too.
+        try:
+            return await asyncio.shield(_refresh_credentials(user_id, creds))
+        except Exception:
+            # The request refreshes the credentials again and fails the same
+            # way as before, where the error is handled
+            return creds
+    if _expires_soon(creds):
+        _refresh_credentials(user_id, creds)
+
+    return creds
+
+
+async def _load_credentials(
+    user_id: Union[int, str], previous_creds: Optional[Credentials]
+) -> Credentials:
     user_credentials = await _load_user_credentials(user_id)
+    if (
+        previous_creds is not None
+        and previous_creds.refresh_token == user_credentials["refresh_token"]
+    ):
+        # Keep the access token of the credentials loaded before
+        return previous_creds
+
     sheets_credentials: Dict[str, str] = {
         "refresh_token": user_credentials["refresh_token"],
         "client_id": oauth2_settings["clientId"],
         "client_secret": oauth2_settings["clientSecret"],
     }
 
-    creds = Credentials.from_authorized_user_info(  # type: ignore[no-untyped-call]
+    creds: Credentials = Credentials.from_authorized_user_info(  # type: ignore[no-untyped-call]
         info=sheets_credentials,
         scopes=[
             "https://www.googleapis.com/auth/spreadsheets",
             "https://www.googleapis.com/auth/drive.metadata.readonly",
         ],
     )
-    service = build(serviceName=service_name, version=version, credentials=creds)
+    return creds
+
+
+@lru_cache(maxsize=None)
+def _get_discovery_document(service_name: str, version: str) -> str:
+    # The discovery documents are bundled with googleapiclient, they only have
+    # to be read once instead of in every build() call. The JSON string is
+    # cached, since build_from_document modifies a parsed document.
+    document = discovery_cache.get_static_doc(service_name, version)
+    if document is None:
+        raise ValueError(f"No discovery document for '{service_name}' '{version}'")
+    return document  # type: ignore[no-any-return]
+
+
+async def build_service(user_id: int, service_name: str, version: str) -> Any:
+    creds = await _get_user_credentials(user_id)
+    http = AuthorizedHttp(creds, http=_ThreadLocalHttp())
+    service = build_from_document(
+        _get_discovery_document(service_name, version), http=http
+    )
+    _service_semaphores[service] = _get_user_semaphore(user_id)
+    _service_users[service] = user_id
     return service
 
 
-@asyncify  # type: ignore[misc]
-def get_files_f(service: Any) -> List[Dict[str, str]]:
+def _quote_query_string(value: str) -> str:
+    # String values in Drive queries are single-quoted, with quotes and
+    # backslashes escaped by a backslash
+    value = value.replace("\\", "\\\\").replace("'", "\\'")
+    return f"'{value}'"
+
+
+@_run_in_executor
+def get_files_f(
+    service: Any, name_contains: Optional[str] = None, owned_only: bool = False
+) -> List[Dict[str, str]]:
+    # Filter on the server, so that only the needed files are sent back. Files
+    # shared with the user are listed unless owned_only is set, since template
+    # spreadsheets are often shared rather than owned.
+    q = "mimeType='application/vnd.google-apps.spreadsheet' and trashed=false"
+    if owned_only:
+        q += " and 'me' in owners"
+    if name_contains:
+        q += f" and name contains {_quote_query_string(name_contains)}"
+
     # Call the Drive v3 API
-    results = (
-        service.files()
-        .list(
-            q="mimeType='application/vnd.google-apps.spreadsheet'",
-            pageSize=100,  # The default value is 100
-            fields="nextPageToken, files(id, name)",
+    files = service.files()
+    items: List[Dict[str, str]] = []
+    page_token = None
+    while True:
+        results = _execute(
+            files.list(
+                q=q,
+                orderBy="modifiedTime desc",
+                pageSize=1000,  # The maximum value, the default is 100
+                fields="nextPageToken, files(id, name)",
+                pageToken=page_token,
+            )
         )
-        .execute()
-    )
-    items = results.get("files", [])
-    return items  # type: ignore[no-any-return]
+        items.extend(results.get("files", []))
+        page_token = results.get("nextPageToken")
+        if page_token is None:
+            return items
 
 
-@asyncify  # type: ignore[misc]
-def get_sheet_f(service: Any, spreadsheet_id: str, range: str) -> Any:
+@_run_in_executor
+def get_sheet_f(
+    service: Any,
+    spreadsheet_id: str,
+    range: str,
+    value_render_option: ValueRenderOption = "FORMATTED_VALUE",
+) -> Any:
     # Call the Sheets API
     sheet = service.spreadsheets()
     try:
-        result = sheet.values().get(spreadsheetId=spreadsheet_id, range=range).execute()
+        result = _execute(
+            sheet.values().get(
+                spreadsheetId=spreadsheet_id,
+                range=range,
+                valueRenderOption=value_render_option,
+                fields="values",
+            )
+        )
         values = result.get("values", [])
     except Exception as e:
         raise HTTPException(
@@ -83,7 +429,36 @@ def get_sheet_f(service: Any, spreadsheet_id: str, range: str) -> Any:
     return values
 
 
-@asyncify  # type: ignore[misc]
+@_run_in_executor
+def batch_get_sheets_f(
+    service: Any,
+    spreadsheet_id: str,
+    ranges: List[str],
+    value_render_option: ValueRenderOption = "FORMATTED_VALUE",
+) -> List[List[List[Any]]]:
+    # Read all ranges in a single call, the values are in the order of the ranges
+    sheet = service.spreadsheets()
+    try:
+        result = _execute(
+            sheet.values().batchGet(
+                spreadsheetId=spreadsheet_id,
+                ranges=ranges,
+                valueRenderOption=value_render_option,
+                fields="valueRanges(values)",
+            )
+        )
+    except Exception as e:
+        raise HTTPException(
+            status_code=404,
+            detail=f"Unable to read from spreadsheet with id '{spreadsheet_id}', and ranges {ranges}",
+        ) from e
+
+    return [
+        value_range.get("values", []) for value_range in result.get("valueRanges", [])
+    ]
+
+
+@_run_in_executor
 def update_sheet_f(
     service: Any, spreadsheet_id: str, range: str, sheet_values: GoogleSheetValues
 ) -> None:
@@ -99,10 +474,34 @@ def update_sheet_f(
             body={"majorDimension": "ROWS", "values": sheet_values.values},
         )
     )
-    request.execute()
+    _execute(request)
 
 
-@asyncify  # type: ignore[misc]
+@_run_in_executor
+def batch_update_sheets_f(
+    service: Any,
+    spreadsheet_id: str,
+    updates: List[Tuple[str, GoogleSheetValues]],
+) -> None:
+    # Write all (range, values) pairs in a single call
+    request = (
+        service.spreadsheets()
+        .values()
+        .batchUpdate(
+            spreadsheetId=spreadsheet_id,
+            body={
+                "valueInputOption": "RAW",
+                "data": [
+                    {"range": range, "majorDimension": "ROWS", "values": values.values}
+                    for range, values in updates
+                ],
+            },
+        )
+    )
+    _execute(request)
+
+
+@_run_in_executor
 def create_sheet_f(service: Any, spreadsheet_id: str, title: str) -> None:
     body = {
         "requests": [
@@ -121,8 +520,19 @@ def create_sheet_f(service: Any, spreadsheet_id: str, title: str) -> None:
     request.execute()
 
 
-@asyncify  # type: ignore[misc]
+@_run_in_executor
+def create_sheets_f(service: Any, spreadsheet_id: str, titles: List[str]) -> None:
+    body = {
+        "requests": [{"addSheet": {"properties": {"title": title}}} for title in titles]
+    }
+    request = service.spreadsheets().batchUpdate(
+        spreadsheetId=spreadsheet_id, body=body
+    )
+    request.execute()
+
+
+@_run_in_executor
 def get_all_sheet_titles_f(service: Any, spreadsheet_id: str) -> List[str]:
-    sheet_metadata = service.spreadsheets().get(spreadsheetId=spreadsheet_id).execute()
+    sheet_metadata = _execute(service.spreadsheets().get(spreadsheetId=spreadsheet_id))
     sheets = sheet_metadata.get("sheets", "")
     return [sheet["properties"]["title"] for sheet in sheets]
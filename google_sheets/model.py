@@ -1,10 +1,27 @@
-from typing import Any, List
+from typing import Annotated, Any, List
 
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, ConfigDict, Field, PlainValidator
+
+
+def _validate_values(values: Any) -> List[List[Any]]:
+    # Only the rows are checked, the cells can be anything so walking them
+    # in the default List[List[Any]] validation is not needed
+    if not isinstance(values, list) or not all(isinstance(row, list) for row in values):
+        raise ValueError("Values should be a list of rows")
+    return values
 
 
 class GoogleSheetValues(BaseModel):
-    values: List[List[Any]] = Field(
+    # Unknown fields are still ignored, forbidding them would reject request
+    # bodies which are accepted today
+    model_config = ConfigDict(frozen=True)
+
+    # Without json_schema_input_type the values would have no type in the
+    # OpenAPI schema
+    values: Annotated[
+        List[List[Any]],
+        PlainValidator(_validate_values, json_schema_input_type=List[List[Any]]),
+    ] = Field(
         ..., title="Values", description="Values to be written to the Google Sheet."
     )
     issues_present: bool = Field(
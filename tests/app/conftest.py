@@ -0,0 +1,33 @@
+from typing import Iterator
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+from fastapi.testclient import TestClient
+
+from google_sheets.app import app
+
+
+@pytest.fixture(scope="session")
+def client() -> Iterator[TestClient]:
+    with TestClient(app) as client:
+        # Build the schema once so /openapi.json only serves the cached dict
+        app.openapi()
+        yield client
+
+
+@pytest.fixture(autouse=True, scope="module")
+def mock_load_user_credentials() -> Iterator[AsyncMock]:
+    # Patched once per module, tests asserting calls compare call_count
+    # snapshots
+    with patch(
+        "google_sheets.google_api.service._load_user_credentials",
+        new_callable=AsyncMock,
+        return_value={"refresh_token": "abcdf"},
+    ) as mock:
+        yield mock
+
+
+@pytest.fixture(autouse=True)
+def stub_credentials_refresh(refresh_credentials: MagicMock) -> MagicMock:
+    # The credentials built by these tests are refreshed on first use
+    return refresh_credentials
@@ -1,22 +1,31 @@
-from typing import Any, Dict, List, Optional, Union
-from unittest.mock import MagicMock, patch
+from types import SimpleNamespace
+from typing import Any, Dict, List, Optional, Tuple, Union
+from unittest.mock import AsyncMock, MagicMock
 
 import pandas as pd
 import pytest
 from fastapi import HTTPException
 from fastapi.testclient import TestClient
 from googleapiclient.errors import HttpError
+from httpx import Response
+from pytest_mock import MockerFixture
 
 from google_sheets.app import (
     _check_parameters_are_not_none,
     _fill_rows_with_none,
+    _get_sheets,
     app,
     process_campaign_data,
     process_data,
 )
+from google_sheets.db_helpers import DBClients
+from google_sheets.google_api import service
 from google_sheets.model import GoogleSheetValues
 
-client = TestClient(app)
+
+@pytest.fixture(autouse=True)
+def clear_credentials_cache() -> None:
+    service._credentials_cache.clear()
 
 
 class TestGetSheet:
@@ -59,96 +68,171 @@ class TestGetSheet:
         filled_sheet_values = _fill_rows_with_none(values)
         assert filled_sheet_values == expected
 
-    def test_get_sheet(self) -> None:
-        with patch(
-            "google_sheets.google_api.service._load_user_credentials",
-            return_value={"refresh_token": "abcdf"},
-        ) as mock_load_user_credentials:
-            values = [
-                ["Campaign", "Ad Group", "Keyword"],
-                ["Campaign A", "Ad group A", "Keyword A"],
-                ["Campaign A", "Ad group A", "Keyword B"],
-                ["Campaign A", "Ad group A", "Keyword C"],
-            ]
-            with patch(
-                "google_sheets.app.get_sheet_f", return_value=values
-            ) as mock_get_sheet:
-                response = client.get(
-                    "/get-sheet?user_id=123&spreadsheet_id=abc&title=Sheet1"
-                )
-                mock_load_user_credentials.assert_called_once()
-                mock_get_sheet.assert_called_once()
-                assert response.status_code == 200
+    @pytest.mark.asyncio
+    async def test_get_sheets(
+        self, mocker: MockerFixture, mock_load_user_credentials: AsyncMock
+    ) -> None:
+        calls_before = mock_load_user_credentials.call_count
+        mocker.patch(
+            "google_sheets.app.batch_get_sheets_f",
+            return_value=[[["Campaign", "Ad Group"], ["Campaign A"]], []],
+        )
 
-                excepted = GoogleSheetValues(values=values).model_dump()
-                assert response.json() == excepted
+        sheets = await _get_sheets(
+            user_id=123, spreadsheet_id="abc", titles=["Sheet1", "Sheet2"]
+        )
+        assert mock_load_user_credentials.call_count == calls_before + 1
+        assert sheets == [
+            GoogleSheetValues(values=[["Campaign", "Ad Group"], ["Campaign A", None]]),
+            "No data found.",
+        ]
 
 
 def _create_http_error_mock(reason: str, status: int) -> HttpError:
-    resp = MagicMock()
-    resp.reason = reason
-    resp.status = status
+    resp = SimpleNamespace(reason=reason, status=status)
 
     return HttpError(resp=resp, content=b"")
 
 
+SHEET_EXISTS_ERROR = _create_http_error_mock(
+    'A sheet with the name "Sheet2" already exists', 400
+)
+BAD_REQUEST_ERROR = _create_http_error_mock("Bad Request", 400)
+
+
+def _post_with_side_effect(
+    client: TestClient,
+    mocker: MockerFixture,
+    target: str,
+    side_effect: Optional[Union[HttpError, Exception]],
+    url: str,
+    json: Optional[Dict[str, Any]] = None,
+) -> Tuple[Response, MagicMock]:
+    mock = mocker.patch(target, side_effect=[side_effect])
+    response = client.post(url, json=json)
+    return response, mock
+
+
 class TestCreateSheet:
     @pytest.mark.parametrize(
         ("side_effect", "expected_status_code"),
         [
             (None, 201),
-            (
-                _create_http_error_mock(
-                    'A sheet with the name "Sheet2" already exists', 400
-                ),
-                400,
-            ),
-            (_create_http_error_mock("Bad Request", 400), 400),
+            (SHEET_EXISTS_ERROR, 400),
+            (BAD_REQUEST_ERROR, 400),
             (Exception("Some error"), 500),
         ],
+        ids=["ok", "sheet_exists", "bad_request", "server_error"],
     )
     def test_create_sheet(
         self,
+        client: TestClient,
+        mocker: MockerFixture,
+        mock_load_user_credentials: AsyncMock,
         side_effect: Optional[Union[HttpError, Exception]],
         expected_status_code: int,
     ) -> None:
-        with (
-            patch(
-                "google_sheets.google_api.service._load_user_credentials",
-                return_value={"refresh_token": "abcdf"},
-            ) as mock_load_user_credentials,
-            patch(
-                "google_sheets.app.create_sheet_f", side_effect=[side_effect]
-            ) as mock_create_sheet,
-        ):
-            response = client.post(
-                "/create-sheet?user_id=123&spreadsheet_id=abc&title=Sheet2"
-            )
-            mock_load_user_credentials.assert_called_once()
+        calls_before = mock_load_user_credentials.call_count
+        response, mock_create_sheet = _post_with_side_effect(
+            client,
+            mocker,
+            "google_sheets.app.create_sheet_f",
+            side_effect,
+            "/create-sheet?user_id=123&spreadsheet_id=abc&title=Sheet2",
+        )
+        assert response.status_code == expected_status_code
+        # The error statuses can only come from the single side effect
+        if side_effect is None:
+            assert mock_load_user_credentials.call_count == calls_before + 1
             mock_create_sheet.assert_called_once()
-            assert response.status_code == expected_status_code
 
 
-class TestGetAllSheetTitles:
-    def test_get_all_sheet_titles(self) -> None:
-        with (
-            patch(
-                "google_sheets.google_api.service._load_user_credentials",
-                return_value={"refresh_token": "abcdf"},
-            ) as mock_load_user_credentials,
-            patch(
+SHEET_VALUES = [
+    ["Campaign", "Ad Group", "Keyword"],
+    ["Campaign A", "Ad group A", "Keyword A"],
+    ["Campaign A", "Ad group A", "Keyword B"],
+    ["Campaign A", "Ad group A", "Keyword C"],
+]
+
+
+class TestGetEndpoints:
+    @pytest.mark.parametrize(
+        ("target", "return_value", "url", "expected"),
+        [
+            (
+                "google_sheets.app.get_sheet_f",
+                SHEET_VALUES,
+                "/get-sheet?user_id=123&spreadsheet_id=abc&title=Sheet1",
+                {"values": SHEET_VALUES, "issues_present": False},
+            ),
+            (
                 "google_sheets.app.get_all_sheet_titles_f",
-                return_value=["Sheet1", "Sheet2"],
-            ) as mock_get_all_sheet_titles,
-        ):
-            expected = ["Sheet1", "Sheet2"]
-            response = client.get(
-                "/get-all-sheet-titles?user_id=123&spreadsheet_id=abc"
-            )
-            mock_load_user_credentials.assert_called_once()
-            mock_get_all_sheet_titles.assert_called_once()
-            assert response.status_code == 200
-            assert response.json() == expected
+                ["Sheet1", "Sheet2"],
+                "/get-all-sheet-titles?user_id=123&spreadsheet_id=abc",
+                ["Sheet1", "Sheet2"],
+            ),
+            (
+                "google_sheets.app.get_files_f",
+                [{"id": "abc", "name": "file1"}, {"id": "def", "name": "file2"}],
+                "/get-all-file-names?user_id=123",
+                {"abc": "file1", "def": "file2"},
+            ),
+        ],
+        ids=["get_sheet", "get_all_sheet_titles", "get_all_file_names"],
+    )
+    def test_get_endpoint(
+        self,
+        client: TestClient,
+        mocker: MockerFixture,
+        mock_load_user_credentials: AsyncMock,
+        target: str,
+        return_value: Any,
+        url: str,
+        expected: Any,
+    ) -> None:
+        calls_before = mock_load_user_credentials.call_count
+        mocker.patch(target, return_value=return_value)
+
+        response = client.get(url)
+        assert mock_load_user_credentials.call_count == calls_before + 1
+        assert response.status_code == 200
+        assert response.json() == expected
+
+    def test_get_all_file_names_name_contains(
+        self, client: TestClient, mocker: MockerFixture
+    ) -> None:
+        mock_get_files = mocker.patch("google_sheets.app.get_files_f", return_value=[])
+
+        response = client.get("/get-all-file-names?user_id=123&name_contains=Bob's")
+
+        assert response.status_code == 200
+        assert mock_get_files.call_args.kwargs["name_contains"] == "Bob's"
+
+    @pytest.mark.parametrize(
+        ("query", "expected"),
+        [("", "FORMATTED_VALUE"), ("&value_render_option=FORMULA", "FORMULA")],
+        ids=["default", "formula"],
+    )
+    def test_get_sheet_value_render_option(
+        self, client: TestClient, mocker: MockerFixture, query: str, expected: str
+    ) -> None:
+        mock_get_sheet = mocker.patch(
+            "google_sheets.app.get_sheet_f", return_value=SHEET_VALUES
+        )
+
+        response = client.get(
+            f"/get-sheet?user_id=123&spreadsheet_id=abc&title=Sheet1{query}"
+        )
+
+        assert response.status_code == 200
+        assert mock_get_sheet.call_args.kwargs["value_render_option"] == expected
+
+    def test_get_sheet_invalid_value_render_option(self, client: TestClient) -> None:
+        response = client.get(
+            "/get-sheet?user_id=123&spreadsheet_id=abc&title=Sheet1&value_render_option=RAW"
+        )
+
+        assert response.status_code == 422
 
 
 class TestUpdateSheet:
@@ -156,59 +240,38 @@ class TestUpdateSheet:
         ("side_effect", "expected_status_code"),
         [
             (None, 200),
-            (_create_http_error_mock("Bad Request", 400), 400),
+            (BAD_REQUEST_ERROR, 400),
             (Exception("Some error"), 500),
         ],
+        ids=["ok", "bad_request", "server_error"],
     )
     def test_update_sheet(
         self,
+        client: TestClient,
+        mocker: MockerFixture,
+        mock_load_user_credentials: AsyncMock,
         side_effect: Optional[Union[HttpError, Exception]],
         expected_status_code: int,
     ) -> None:
-        with (
-            patch(
-                "google_sheets.google_api.service._load_user_credentials",
-                return_value={"refresh_token": "abcdf"},
-            ) as mock_load_user_credentials,
-            patch(
-                "google_sheets.app.update_sheet_f", side_effect=[side_effect]
-            ) as mock_update_sheet,
-        ):
-            json_data = {
-                "sheet_values": {
-                    "values": [["Campaign", "Ad Group"], ["Campaign A", "Ad group A"]]
-                }
+        calls_before = mock_load_user_credentials.call_count
+        json_data = {
+            "sheet_values": {
+                "values": [["Campaign", "Ad Group"], ["Campaign A", "Ad group A"]]
             }
-            response = client.post(
-                "/update-sheet?user_id=123&spreadsheet_id=abc&title=Sheet1",
-                json=json_data,
-            )
-            mock_load_user_credentials.assert_called_once()
+        }
+        response, mock_update_sheet = _post_with_side_effect(
+            client,
+            mocker,
+            "google_sheets.app.update_sheet_f",
+            side_effect,
+            "/update-sheet?user_id=123&spreadsheet_id=abc&title=Sheet1",
+            json=json_data,
+        )
+        assert response.status_code == expected_status_code
+        # The error statuses can only come from the single side effect
+        if side_effect is None:
+            assert mock_load_user_credentials.call_count == calls_before + 1
             mock_update_sheet.assert_called_once()
-            assert response.status_code == expected_status_code
-
-
-class TestGetAllFileNames:
-    def test_get_all_file_names(self) -> None:
-        with (
-            patch(
-                "google_sheets.google_api.service._load_user_credentials",
-                return_value={"refresh_token": "abcdf"},
-            ) as mock_load_user_credentials,
-            patch(
-                "google_sheets.app.get_files_f",
-                return_value=[
-                    {"id": "abc", "name": "file1"},
-                    {"id": "def", "name": "file2"},
-                ],
-            ) as mock_get_files,
-        ):
-            expected = {"abc": "file1", "def": "file2"}
-            response = client.get("/get-all-file-names?user_id=123")
-            mock_load_user_credentials.assert_called_once()
-            mock_get_files.assert_called_once()
-            assert response.status_code == 200
-            assert response.json() == expected
 
 
 class TestProcessCampaignData:
@@ -315,7 +378,7 @@ class TestProcessCampaignData:
                 template_sheet_values=template_sheet_values,
                 new_campaign_sheet_values=new_campaign_sheet_values,
             )
-            assert processed_data.model_dump() == detail.model_dump()
+            assert processed_data == detail
         else:
             with pytest.raises(HTTPException) as exc:
                 await process_campaign_data(
@@ -325,158 +388,186 @@ class TestProcessCampaignData:
             assert detail in exc.value.detail
 
 
+SINGLE_ROW_TEMPLATE = GoogleSheetValues(
+    values=[
+        ["Keyword"],
+    ]
+)
+
+SINGLE_ROW_NEW_CAMPAIGN = GoogleSheetValues(
+    values=[
+        [
+            "Country",
+            "Station From",
+            "Station To",
+            "Final Url From",
+            "Final Url To",
+        ],
+        [
+            "India",
+            "Delhi",
+            "Mumbai",
+            "https://www.example.com/from",
+            "https://www.example.com/to",
+        ],
+    ]
+)
+
+MISSING_COLUMNS_TEMPLATE = GoogleSheetValues(
+    values=[
+        ["Fake column", "Category"],
+        ["fake", "Bus"],
+    ]
+)
+
+MISSING_COLUMNS_NEW_CAMPAIGN = GoogleSheetValues(
+    values=[
+        [
+            "Country",
+            "Station From",
+            "Station To",
+            "Final Url From",
+            "Final Url To",
+            "Language Code",
+            "Category",
+        ],
+        [
+            "India",
+            "Delhi",
+            "Mumbai",
+            "https://www.example.com/from",
+            "https://www.example.com/to",
+            "EN",
+            "Bus",
+        ],
+    ]
+)
+
+KEYWORD_TEMPLATE = GoogleSheetValues(
+    values=[
+        [
+            "Keyword",
+            "Keyword Match Type",
+            "Level",
+            "Negative",
+            "Language Code",
+            "Category",
+        ],
+        [
+            "Keyword A",
+            "Exact",
+            None,
+            "False",
+            "EN",
+            "Bus",
+        ],
+        [
+            "Keyword N",
+            "Broad",
+            "Campaign",
+            "True",
+            "EN",
+            "Bus",
+        ],
+    ]
+)
+
+KEYWORD_NEW_CAMPAIGN = GoogleSheetValues(
+    values=[
+        [
+            "Country",
+            "Station From",
+            "Station To",
+            "Final Url From",
+            "Final Url To",
+            "Language Code",
+            "Category",
+            "Ticket Price",
+        ],
+        [
+            "India",
+            "Delhi",
+            "Mumbai",
+            "https://www.example.com/from",
+            "https://www.example.com/to",
+            "EN",
+            "Bus",
+            "10.5",
+        ],
+    ]
+)
+
+KEYWORD_EXPECTED = GoogleSheetValues(
+    values=[
+        [
+            "Campaign Name",
+            "Ad Group Name",
+            "Match Type",
+            "Keyword",
+            "Level",
+            "Negative",
+        ],
+        [
+            "India - Delhi - Mumbai - EN",
+            "Delhi - Mumbai",
+            "Exact",
+            "Keyword A",
+            None,
+            "False",
+        ],
+        [
+            "India - Delhi - Mumbai - EN",
+            "Mumbai - Delhi",
+            "Exact",
+            "Keyword A",
+            None,
+            "False",
+        ],
+        [
+            "India - Delhi - Mumbai - EN",
+            None,
+            "Broad",
+            "Keyword N",
+            "Campaign",
+            "True",
+        ],
+    ],
+)
+
+
 class TestProcessData:
+    @pytest.fixture(scope="class")
+    def merged_campaigns_ad_groups_df(self) -> pd.DataFrame:
+        return pd.DataFrame(
+            {
+                "Campaign Name": [
+                    "{INSERT_COUNTRY} - {INSERT_STATION_FROM} - {INSERT_STATION_TO} - {INSERT_LANGUAGE_CODE}"
+                ],
+                "Language Code": ["EN"],
+                "Ad Group Name": ["{INSERT_STATION_FROM} - {INSERT_STATION_TO}"],
+                "Match Type": ["Exact"],
+                "Target Category": ["True"],
+                "Ad Group Category": ["Bus"],
+                "Real Category": ["Bus"],
+            }
+        )
+
     @pytest.mark.parametrize(
         ("template_sheet_values", "new_campaign_sheet_values", "detail"),
         [
             (
-                GoogleSheetValues(
-                    values=[
-                        ["Keyword"],
-                    ]
-                ),
-                GoogleSheetValues(
-                    values=[
-                        [
-                            "Country",
-                            "Station From",
-                            "Station To",
-                            "Final Url From",
-                            "Final Url To",
-                        ],
-                        [
-                            "India",
-                            "Delhi",
-                            "Mumbai",
-                            "https://www.example.com/from",
-                            "https://www.example.com/to",
-                        ],
-                    ]
-                ),
+                SINGLE_ROW_TEMPLATE,
+                SINGLE_ROW_NEW_CAMPAIGN,
                 "Both template and new campaign data should have at least two rows",
             ),
             (
-                GoogleSheetValues(
-                    values=[
-                        ["Fake column", "Category"],
-                        ["fake", "Bus"],
-                    ]
-                ),
-                GoogleSheetValues(
-                    values=[
-                        [
-                            "Country",
-                            "Station From",
-                            "Station To",
-                            "Final Url From",
-                            "Final Url To",
-                            "Language Code",
-                            "Category",
-                        ],
-                        [
-                            "India",
-                            "Delhi",
-                            "Mumbai",
-                            "https://www.example.com/from",
-                            "https://www.example.com/to",
-                            "EN",
-                            "Bus",
-                        ],
-                    ]
-                ),
+                MISSING_COLUMNS_TEMPLATE,
+                MISSING_COLUMNS_NEW_CAMPAIGN,
                 "Mandatory columns missing in the keyword template data.",
             ),
-            (
-                GoogleSheetValues(
-                    values=[
-                        [
-                            "Keyword",
-                            "Keyword Match Type",
-                            "Level",
-                            "Negative",
-                            "Language Code",
-                            "Category",
-                        ],
-                        [
-                            "Keyword A",
-                            "Exact",
-                            None,
-                            "False",
-                            "EN",
-                            "Bus",
-                        ],
-                        [
-                            "Keyword N",
-                            "Broad",
-                            "Campaign",
-                            "True",
-                            "EN",
-                            "Bus",
-                        ],
-                    ]
-                ),
-                GoogleSheetValues(
-                    values=[
-                        [
-                            "Country",
-                            "Station From",
-                            "Station To",
-                            "Final Url From",
-                            "Final Url To",
-                            "Language Code",
-                            "Category",
-                            "Ticket Price",
-                        ],
-                        [
-                            "India",
-                            "Delhi",
-                            "Mumbai",
-                            "https://www.example.com/from",
-                            "https://www.example.com/to",
-                            "EN",
-                            "Bus",
-                            "10.5",
-                        ],
-                    ]
-                ),
-                GoogleSheetValues(
-                    values=[
-                        [
-                            "Campaign Name",
-                            "Ad Group Name",
-                            "Match Type",
-                            "Keyword",
-                            "Level",
-                            "Negative",
-                        ],
-                        [
-                            "India - Delhi - Mumbai - EN",
-                            "Delhi - Mumbai",
-                            "Exact",
-                            "Keyword A",
-                            None,
-                            "False",
-                        ],
-                        [
-                            "India - Delhi - Mumbai - EN",
-                            "Mumbai - Delhi",
-                            "Exact",
-                            "Keyword A",
-                            None,
-                            "False",
-                        ],
-                        [
-                            "India - Delhi - Mumbai - EN",
-                            None,
-                            "Broad",
-                            "Keyword N",
-                            "Campaign",
-                            "True",
-                        ],
-                    ],
-                ),
-            ),
+            (KEYWORD_TEMPLATE, KEYWORD_NEW_CAMPAIGN, KEYWORD_EXPECTED),
         ],
+        ids=["too_few_rows", "missing_columns", "keyword"],
     )
     @pytest.mark.asyncio
     async def test_process_data_keywords(
@@ -484,20 +575,10 @@ class TestProcessData:
         template_sheet_values: GoogleSheetValues,
         new_campaign_sheet_values: GoogleSheetValues,
         detail: Union[str, GoogleSheetValues],
+        merged_campaigns_ad_groups_df: pd.DataFrame,
     ) -> None:
-        merged_campaigns_ad_groups_df = pd.DataFrame(
-            {
-                "Campaign Name": [
-                    "{INSERT_COUNTRY} - {INSERT_STATION_FROM} - {INSERT_STATION_TO} - {INSERT_LANGUAGE_CODE}"
-                ],
-                "Language Code": ["EN"],
-                "Ad Group Name": ["{INSERT_STATION_FROM} - {INSERT_STATION_TO}"],
-                "Match Type": ["Exact"],
-                "Target Category": ["True"],
-                "Ad Group Category": ["Bus"],
-                "Real Category": ["Bus"],
-            }
-        )
+        # process_data lowercases the category columns in place
+        merged_campaigns_ad_groups_df = merged_campaigns_ad_groups_df.copy()
         if isinstance(detail, GoogleSheetValues):
             processed_data = await process_data(
                 template_sheet_values=template_sheet_values,
@@ -505,7 +586,7 @@ class TestProcessData:
                 merged_campaigns_ad_groups_df=merged_campaigns_ad_groups_df,
                 target_resource="keyword",
             )
-            assert processed_data.model_dump() == detail.model_dump()
+            assert processed_data == detail
 
         else:
             with pytest.raises(HTTPException) as exc:
@@ -641,16 +722,188 @@ class TestProcessData:
             issues_present=True,
         )
 
-        assert result.model_dump() == expected.model_dump()
+        assert result == expected
 
 
-class TestOpenAPIJSON:
-    def test_openapi(self) -> None:
-        response = client.get("/openapi.json")
-        assert response.status_code == 200
+PROCESS_SPREADSHEET_URL = "/process-spreadsheet?user_id=123&template_spreadsheet_id=abc&new_campaign_spreadsheet_id=def&new_campaign_sheet_title=Sheet1"
+
+
+class TestProcessSpreadsheet:
+    @pytest.mark.parametrize(
+        ("new_campaign_side_effect", "expected_status_code", "expected_detail"),
+        [
+            (
+                HTTPException(status_code=404, detail="New campaign error"),
+                404,
+                "New campaign error",
+            ),
+            (
+                [[["Country"], ["USA"]]],
+                400,
+                "Make sure tables 'Campaigns', 'Ad Groups', 'Ads' and 'Keywords' are present",
+            ),
+        ],
+        ids=["both_fail", "template_fails"],
+    )
+    def test_read_errors(
+        self,
+        client: TestClient,
+        mocker: MockerFixture,
+        new_campaign_side_effect: Any,
+        expected_status_code: int,
+        expected_detail: str,
+    ) -> None:
+        # The new campaign error wins even though both reads fail
+        mocker.patch(
+            "google_sheets.app.get_sheet_f", side_effect=new_campaign_side_effect
+        )
+        mocker.patch(
+            "google_sheets.app.batch_get_sheets_f",
+            side_effect=HTTPException(status_code=404, detail="Template error"),
+        )
+        mock_create_sheets = mocker.patch("google_sheets.app.create_sheets_f")
+
+        response = client.post(PROCESS_SPREADSHEET_URL)
+
+        assert response.status_code == expected_status_code
+        assert expected_detail in response.json()["detail"]
+        mock_create_sheets.assert_not_called()
+
+    @pytest.mark.parametrize(
+        (
+            "create_side_effect",
+            "update_side_effect",
+            "expected_status_code",
+            "expected_detail",
+        ),
+        [
+            (None, None, 200, "has been created successfully"),
+            (Exception("Create error"), None, 500, "Create error"),
+            (None, Exception("Update error"), 500, "Update error"),
+            (BAD_REQUEST_ERROR, None, 400, "Bad Request"),
+            (
+                None,
+                _create_http_error_mock("The caller does not have permission", 403),
+                403,
+                "The caller does not have permission",
+            ),
+        ],
+        ids=[
+            "ok",
+            "create_fails",
+            "update_fails",
+            "create_http_error",
+            "update_http_error",
+        ],
+    )
+    def test_create_and_update_sheets(
+        self,
+        client: TestClient,
+        mocker: MockerFixture,
+        create_side_effect: Optional[Exception],
+        update_side_effect: Optional[Exception],
+        expected_status_code: int,
+        expected_detail: str,
+    ) -> None:
+        values = [["Country"], ["USA"]]
+        mocker.patch("google_sheets.app.get_sheet_f", return_value=values)
+        mocker.patch("google_sheets.app.batch_get_sheets_f", return_value=[values] * 4)
+        mocker.patch(
+            "google_sheets.app.process_campaigns_and_ad_groups",
+            return_value=pd.DataFrame(
+                columns=[
+                    "Campaign Budget",
+                    "Search Network",
+                    "Google Search Network",
+                    "Default max. CPC",
+                ]
+            ),
+        )
+        processed_values = GoogleSheetValues(values=values)
+        for target in ["process_campaign_data", "process_data"]:
+            mocker.patch(f"google_sheets.app.{target}", return_value=processed_values)
+        mock_create_sheets = mocker.patch(
+            "google_sheets.app.create_sheets_f", side_effect=create_side_effect
+        )
+        mock_batch_update_sheets = mocker.patch(
+            "google_sheets.app.batch_update_sheets_f", side_effect=update_side_effect
+        )
+
+        response = client.post(PROCESS_SPREADSHEET_URL)
+
+        assert response.status_code == expected_status_code
+        assert expected_detail in (
+            response.text if expected_status_code == 200 else response.json()["detail"]
+        )
+        # All three sheets are created with one request and filled with another
+        titles = mock_create_sheets.call_args.kwargs["titles"]
+        assert [title.split(" ")[2] for title in titles] == [
+            "Campaigns",
+            "Ads",
+            "Keywords",
+        ]
+        if create_side_effect is None:
+            updates = mock_batch_update_sheets.call_args.kwargs["updates"]
+            assert updates == [(title, processed_values) for title in titles]
+        else:
+            mock_batch_update_sheets.assert_not_called()
+
+    def test_existing_sheet_name(
+        self, client: TestClient, mocker: MockerFixture
+    ) -> None:
+        values = [["Country"], ["USA"]]
+        mocker.patch("google_sheets.app.get_sheet_f", return_value=values)
+        mocker.patch("google_sheets.app.batch_get_sheets_f", return_value=[values] * 4)
+        mocker.patch(
+            "google_sheets.app.process_campaigns_and_ad_groups",
+            return_value=pd.DataFrame(
+                columns=[
+                    "Campaign Budget",
+                    "Search Network",
+                    "Google Search Network",
+                    "Default max. CPC",
+                ]
+            ),
+        )
+        processed_values = GoogleSheetValues(values=values)
+        for target in ["process_campaign_data", "process_data"]:
+            mocker.patch(f"google_sheets.app.{target}", return_value=processed_values)
+
+        def create_sheets(titles: List[str], **kwargs: Any) -> None:
+            raise _create_http_error_mock(
+                f'A sheet with the name "{titles[1]}" already exists', 400
+            )
+
+        mocker.patch("google_sheets.app.create_sheets_f", side_effect=create_sheets)
+
+        response = client.post(PROCESS_SPREADSHEET_URL)
+
+        assert response.status_code == 400
+        assert response.json()["detail"].endswith(
+            "already exists. Please enter another name."
+        )
+
+
+class TestDBClients:
+    def test_requests_use_the_lifespan_db_clients(
+        self, client: TestClient, mocker: MockerFixture
+    ) -> None:
+        db = MagicMock()
+        db.gauth.find_unique = AsyncMock(return_value={"user_id": 123})
+        get_db = mocker.patch.object(DBClients, "get", autospec=True, return_value=db)
+        prisma = mocker.patch("google_sheets.db_helpers.Prisma")
+
+        response = client.get("/login?user_id=123&conv_uuid=abc")
 
-        paths = response.json()["paths"]
-        expected_path_keys = [
+        assert response.json() == {"login_url": "User is already authenticated"}
+        get_db.assert_awaited_once()
+        prisma.assert_not_called()
+
+
+class TestOpenAPIJSON:
+    @pytest.mark.parametrize(
+        "path",
+        [
             "/login",
             "/login/callback",
             "/get-sheet",
@@ -659,10 +912,16 @@ class TestOpenAPIJSON:
             "/get-all-file-names",
             "/get-all-sheet-titles",
             "/process-spreadsheet",
-        ]
-
-        for key in expected_path_keys:
-            assert key in paths
+        ],
+    )
+    def test_openapi(self, path: str) -> None:
+        assert path in app.openapi()["paths"]
+
+    def test_openapi_sheet_values_schema(self) -> None:
+        schema = app.openapi()["components"]["schemas"]["GoogleSheetValues"]
+        values = schema["properties"]["values"]
+        assert values["type"] == "array"
+        assert values["items"]["type"] == "array"
 
 
 class TestHelperFunctions:
@@ -0,0 +1,20 @@
+from datetime import datetime, timedelta, timezone
+from typing import Any
+from unittest.mock import MagicMock
+
+import pytest
+from google.oauth2.credentials import Credentials
+from pytest_mock import MockerFixture
+
+
+def _refresh(self: Credentials, request: Any) -> None:
+    self.token = "access-token"
+    self.expiry = datetime.now(timezone.utc).replace(tzinfo=None) + timedelta(hours=1)
+
+
+@pytest.fixture
+def refresh_credentials(mocker: MockerFixture) -> MagicMock:
+    # Refreshing the access token would call the Google OAuth server
+    return mocker.patch.object(
+        Credentials, "refresh", autospec=True, side_effect=_refresh
+    )
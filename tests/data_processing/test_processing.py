@@ -1,11 +1,12 @@
-from typing import List, Optional
+from typing import Any, Dict, List, Optional
 
 import pandas as pd
 import pytest
 
 from google_sheets.data_processing.processing import (
-    _copy_all_with_prefixes,
-    _get_target_location,
+    _filter_keyword_template,
+    _get_headline_columns,
+    _get_target_locations,
     _process_row,
     _replace_headline_values,
     _replace_values,
@@ -72,7 +73,7 @@ def test_replace_headline_values() -> None:
         "Station To": "B",
     }
 
-    row = _replace_headline_values(row, station)
+    row = _replace_headline_values(row, station, _get_headline_columns(row.index))
     expected_row = pd.Series(
         {
             "Name": "{INSERT_STATION_FROM}",
@@ -115,42 +116,98 @@ def test_process_row(
             "Real Category": category,
         }
     )
-    new_campaign_row = pd.Series(
-        {
-            "Campaign Name": "USA - A - B - EN",
-            "Country": "USA",
-            "Station From": "A",
-            "Station To": "B",
-            "Language Code": "EN",
-            "Category": category,
-            "Ticket Price": "100",
-        }
-    )
-    final_df = pd.DataFrame(columns=template_row.index)
-    final_df = _process_row(new_campaign_row, template_row, final_df, "keyword")
+    new_campaign_row = {
+        "Campaign Name": "USA - A - B - EN",
+        "Country": "USA",
+        "Station From": "A",
+        "Station To": "B",
+        "Language Code": "EN",
+        "Category": category,
+        "Ticket Price": "100",
+    }
+    rows = _process_row(new_campaign_row, template_row, "Worldwide", "keyword", [])
+    final_df = pd.DataFrame(rows).drop_duplicates(ignore_index=True)
 
     assert len(final_df) == expected_length
     if expected_length == 1:
         assert final_df["Keyword"].values[0] == "k1"
 
 
+def test_filter_keyword_template() -> None:
+    template_df = pd.DataFrame(
+        {
+            "Keyword": ["k1", "k2", "k3", "k4"],
+            "Negative": ["FALSE", "FALSE", "TRUE", "TRUE"],
+            "Keyword Match Type": ["Exact", "Broad", "Exact", "Broad"],
+            "Match Type": ["Exact", "Exact", "Exact", "Exact"],
+        }
+    )
+
+    result = _filter_keyword_template(template_df)
+
+    assert result["Keyword"].tolist() == ["k1", "k3", "k4"]
+
+
+MERGED_CAMPAIGNS_AD_GROUPS_DF = pd.DataFrame(
+    {
+        "Campaign Name": [
+            "{INSERT_COUNTRY} - {INSERT_STATION_FROM} - {INSERT_STATION_TO} - {INSERT_LANGUAGE_CODE}"
+        ],
+        "Language Code": ["EN"],
+        "Ad Group Name": ["{INSERT_STATION_FROM} - {INSERT_STATION_TO}"],
+        "Match Type": ["Exact"],
+        "Target Category": ["False"],
+        "Ad Group Category": ["Bus"],
+        "Real Category": ["Bus"],
+    }
+)
+
+MULTI_LANGUAGE_MERGED_CAMPAIGNS_AD_GROUPS_DF = pd.DataFrame(
+    {
+        "Campaign Name": [
+            "{INSERT_COUNTRY} - {INSERT_STATION_FROM} - {INSERT_STATION_TO} - {INSERT_LANGUAGE_CODE}",
+            "{INSERT_COUNTRY} - {INSERT_STATION_FROM} - {INSERT_STATION_TO} - {INSERT_LANGUAGE_CODE}",
+        ],
+        "Language Code": ["EN", "DE"],
+        "Ad Group Name": [
+            "{INSERT_STATION_FROM} - {INSERT_STATION_TO}",
+            "{INSERT_STATION_FROM} - {INSERT_STATION_TO}",
+        ],
+        "Match Type": ["Exact", "Exact"],
+        "Target Category": ["False", "False"],
+        "Ad Group Category": ["Bus", "Bus"],
+        "Real Category": ["Bus", "Bus"],
+    }
+)
+
+NEW_CAMPAIGN_DF = pd.DataFrame(
+    {
+        "Country": ["USA", "USA"],
+        "Station From": ["A", "B"],
+        "Station To": ["C", "D"],
+        "Language Code": ["EN", "EN"],
+        "Category": ["Bus", "Bus"],
+        "Ticket Price": ["100", "200"],
+    }
+)
+
+MULTI_LANGUAGE_NEW_CAMPAIGN_DF = pd.DataFrame(
+    {
+        "Country": ["USA", "USA"],
+        "Station From": ["A", "B"],
+        "Station To": ["C", "D"],
+        "Language Code": ["EN", "DE"],
+        "Category": ["Bus", "Bus"],
+        "Ticket Price": ["100", "200"],
+    }
+)
+
+
 @pytest.mark.parametrize(
     ("merged_campaigns_ad_groups_df", "template_df", "new_campaign_df", "expected"),
     [
         (
-            pd.DataFrame(
-                {
-                    "Campaign Name": [
-                        "{INSERT_COUNTRY} - {INSERT_STATION_FROM} - {INSERT_STATION_TO} - {INSERT_LANGUAGE_CODE}"
-                    ],
-                    "Language Code": ["EN"],
-                    "Ad Group Name": ["{INSERT_STATION_FROM} - {INSERT_STATION_TO}"],
-                    "Match Type": ["Exact"],
-                    "Target Category": ["False"],
-                    "Ad Group Category": ["Bus"],
-                    "Real Category": ["Bus"],
-                }
-            ),
+            MERGED_CAMPAIGNS_AD_GROUPS_DF,
             pd.DataFrame(
                 {
                     "Keyword": ["k1", "k2"],
@@ -162,16 +219,7 @@ def test_process_row(
                     "Category": ["Bus", "Bus"],
                 }
             ),
-            pd.DataFrame(
-                {
-                    "Country": ["USA", "USA"],
-                    "Station From": ["A", "B"],
-                    "Station To": ["C", "D"],
-                    "Language Code": ["EN", "EN"],
-                    "Category": ["Bus", "Bus"],
-                    "Ticket Price": ["100", "200"],
-                }
-            ),
+            NEW_CAMPAIGN_DF,
             pd.DataFrame(
                 {
                     "Campaign Name": [
@@ -221,19 +269,7 @@ def test_process_row(
             ),
         ),
         (
-            pd.DataFrame(
-                {
-                    "Campaign Name": [
-                        "{INSERT_COUNTRY} - {INSERT_STATION_FROM} - {INSERT_STATION_TO} - {INSERT_LANGUAGE_CODE}"
-                    ],
-                    "Language Code": ["EN"],
-                    "Ad Group Name": ["{INSERT_STATION_FROM} - {INSERT_STATION_TO}"],
-                    "Match Type": ["Exact"],
-                    "Target Category": ["False"],
-                    "Ad Group Category": ["Bus"],
-                    "Real Category": ["Bus"],
-                }
-            ),
+            MERGED_CAMPAIGNS_AD_GROUPS_DF,
             pd.DataFrame(
                 {
                     "Keyword": ["k1 {INSERT_STATION_FROM}", "k2"],
@@ -245,16 +281,7 @@ def test_process_row(
                     "Category": ["Bus", "Bus"],
                 }
             ),
-            pd.DataFrame(
-                {
-                    "Country": ["USA", "USA"],
-                    "Station From": ["A", "B"],
-                    "Station To": ["C", "D"],
-                    "Language Code": ["EN", "EN"],
-                    "Category": ["Bus", "Bus"],
-                    "Ticket Price": ["100", "200"],
-                }
-            ),
+            NEW_CAMPAIGN_DF,
             pd.DataFrame(
                 {
                     "Campaign Name": [
@@ -304,23 +331,7 @@ def test_process_row(
             ),
         ),
         (
-            pd.DataFrame(
-                {
-                    "Campaign Name": [
-                        "{INSERT_COUNTRY} - {INSERT_STATION_FROM} - {INSERT_STATION_TO} - {INSERT_LANGUAGE_CODE}",
-                        "{INSERT_COUNTRY} - {INSERT_STATION_FROM} - {INSERT_STATION_TO} - {INSERT_LANGUAGE_CODE}",
-                    ],
-                    "Language Code": ["EN", "DE"],
-                    "Ad Group Name": [
-                        "{INSERT_STATION_FROM} - {INSERT_STATION_TO}",
-                        "{INSERT_STATION_FROM} - {INSERT_STATION_TO}",
-                    ],
-                    "Match Type": ["Exact", "Exact"],
-                    "Target Category": ["False", "False"],
-                    "Ad Group Category": ["Bus", "Bus"],
-                    "Real Category": ["Bus", "Bus"],
-                }
-            ),
+            MULTI_LANGUAGE_MERGED_CAMPAIGNS_AD_GROUPS_DF,
             pd.DataFrame(
                 {
                     "Keyword": ["k1", "k2"],
@@ -332,16 +343,7 @@ def test_process_row(
                     "Category": ["Bus", "Bus"],
                 }
             ),
-            pd.DataFrame(
-                {
-                    "Country": ["USA", "USA"],
-                    "Station From": ["A", "B"],
-                    "Station To": ["C", "D"],
-                    "Language Code": ["EN", "DE"],
-                    "Category": ["Bus", "Bus"],
-                    "Ticket Price": ["100", "200"],
-                }
-            ),
+            MULTI_LANGUAGE_NEW_CAMPAIGN_DF,
             pd.DataFrame(
                 {
                     "Campaign Name": [
@@ -365,23 +367,7 @@ def test_process_row(
             ),
         ),
         (
-            pd.DataFrame(
-                {
-                    "Campaign Name": [
-                        "{INSERT_COUNTRY} - {INSERT_STATION_FROM} - {INSERT_STATION_TO} - {INSERT_LANGUAGE_CODE}",
-                        "{INSERT_COUNTRY} - {INSERT_STATION_FROM} - {INSERT_STATION_TO} - {INSERT_LANGUAGE_CODE}",
-                    ],
-                    "Language Code": ["EN", "DE"],
-                    "Ad Group Name": [
-                        "{INSERT_STATION_FROM} - {INSERT_STATION_TO}",
-                        "{INSERT_STATION_FROM} - {INSERT_STATION_TO}",
-                    ],
-                    "Match Type": ["Exact", "Exact"],
-                    "Target Category": ["False", "False"],
-                    "Ad Group Category": ["Bus", "Bus"],
-                    "Real Category": ["Bus", "Bus"],
-                }
-            ),
+            MULTI_LANGUAGE_MERGED_CAMPAIGNS_AD_GROUPS_DF,
             pd.DataFrame(
                 {
                     "Keyword": ["k1", "k2"],
@@ -393,16 +379,7 @@ def test_process_row(
                     "Category": ["Bus", "Bus"],
                 }
             ),
-            pd.DataFrame(
-                {
-                    "Country": ["USA", "USA"],
-                    "Station From": ["A", "B"],
-                    "Station To": ["C", "D"],
-                    "Language Code": ["EN", "DE"],
-                    "Category": ["Bus", "Bus"],
-                    "Ticket Price": ["100", "200"],
-                }
-            ),
+            MULTI_LANGUAGE_NEW_CAMPAIGN_DF,
             pd.DataFrame(
                 {
                     "Campaign Name": [
@@ -429,8 +406,12 @@ def test_process_data_f(
     new_campaign_df: pd.DataFrame,
     expected: pd.DataFrame,
 ) -> None:
+    # process_data_f upper-cases the language codes of its inputs in place
     processed_data = process_data_f(
-        merged_campaigns_ad_groups_df, template_df, new_campaign_df, "keyword"
+        merged_campaigns_ad_groups_df.copy(),
+        template_df.copy(),
+        new_campaign_df.copy(),
+        "keyword",
     )
     assert all(processed_data.columns == expected.columns)
 
@@ -443,60 +424,49 @@ def test_process_data_f(
 
 
 @pytest.mark.parametrize(
-    ("new_campaign_row", "new_row", "expected"),
+    ("campaigns_template_df", "new_campaign_df", "expected"),
     [
         (
-            pd.Series(
+            pd.DataFrame(
                 {
-                    "Country": "USA",
-                    "Station From": "A",
-                    "Station To": "B",
-                    "Exclude Location 1": "Austria",
-                    "Include Location 1": "Croatia",
-                    "Include Location 2": "Croatia",
-                    "Include Language 1": "English",
-                    "Exclude Language 1": "German",
-                    "Sitelink Asset ID 1": "111",
-                    "Sitelink Asset ID 2": "222",
+                    "Campaign Name": [
+                        "{INSERT_COUNTRY} - {INSERT_STATION_FROM} - {INSERT_STATION_TO} - {INSERT_LANGUAGE_CODE} | {INSERT_CATEGORY}"
+                    ],
+                    "Language Code": ["EN"],
+                    "Campaign Budget": ["100"],
+                    "Search Network": [True],
+                    "Google Search Network": [False],
+                    "Default max. CPC": [0.3],
                 }
             ),
-            pd.Series(
+            pd.DataFrame(
                 {
-                    "Campaign Name": "USA - A - B - EN",
-                    "Language Code": "EN",
+                    "Country": ["USA", "USA"],
+                    "Station From": ["A", "B"],
+                    "Station To": ["C", "D"],
+                    "Language Code": ["EN", "EN"],
+                    "Category": ["Bus", "Bus"],
                 }
             ),
-            pd.Series(
+            pd.DataFrame(
                 {
-                    "Campaign Name": "USA - A - B - EN",
-                    "Language Code": "EN",
-                    "Exclude Location 1": "Austria",
-                    "Include Location 1": "Croatia",
-                    "Include Location 2": "Croatia",
-                    "Include Language 1": "English",
-                    "Exclude Language 1": "German",
-                    "Sitelink Asset ID 1": "111",
-                    "Sitelink Asset ID 2": "222",
-                }
+                    "Campaign Name": [
+                        "USA - A - C - EN | Bus",
+                        "USA - B - D - EN | Bus",
+                    ],
+                    "Language Code": ["EN", "EN"],
+                    "Campaign Budget": ["100", "100"],
+                    "Search Network": [True, True],
+                    "Google Search Network": [False, False],
+                    "Default max. CPC": [0.3, 0.3],
+                },
             ),
         ),
-    ],
-)
-def test_copy_all_with_prefixes(
-    new_campaign_row: pd.Series, new_row: pd.Series, expected: pd.Series
-) -> None:
-    new_row = _copy_all_with_prefixes(new_campaign_row, new_row)
-    assert new_row.equals(expected)
-
-
-@pytest.mark.parametrize(
-    ("campaigns_template_df", "new_campaign_df", "expected"),
-    [
         (
             pd.DataFrame(
                 {
                     "Campaign Name": [
-                        "{INSERT_COUNTRY} - {INSERT_STATION_FROM} - {INSERT_STATION_TO} - {INSERT_LANGUAGE_CODE} | {INSERT_CATEGORY}"
+                        "{INSERT_COUNTRY} - {INSERT_STATION_FROM} - {INSERT_STATION_TO} | {INSERT_TARGET_LOCATION}"
                     ],
                     "Language Code": ["EN"],
                     "Campaign Budget": ["100"],
@@ -512,19 +482,25 @@ def test_copy_all_with_prefixes(
                     "Station To": ["C", "D"],
                     "Language Code": ["EN", "EN"],
                     "Category": ["Bus", "Bus"],
+                    "Include Location 1": ["Croatia", ""],
+                    "Exclude Location 1": ["Austria", ""],
+                    "Sitelink 1 Text": ["S1", "S2"],
                 }
             ),
             pd.DataFrame(
                 {
                     "Campaign Name": [
-                        "USA - A - C - EN | Bus",
-                        "USA - B - D - EN | Bus",
+                        "USA - A - C | Croatia",
+                        "USA - B - D | Worldwide",
                     ],
                     "Language Code": ["EN", "EN"],
                     "Campaign Budget": ["100", "100"],
                     "Search Network": [True, True],
                     "Google Search Network": [False, False],
                     "Default max. CPC": [0.3, 0.3],
+                    "Include Location 1": ["Croatia", ""],
+                    "Exclude Location 1": ["Austria", ""],
+                    "Sitelink 1 Text": ["S1", "S2"],
                 },
             ),
         ),
@@ -579,6 +555,18 @@ def test_process_campaign_data_f(
             ),
             None,
         ),
+        (
+            pd.DataFrame(
+                columns=[
+                    "Headline 1",
+                    "Headline 2",
+                    "Headline 3",
+                    "Description 1",
+                    "Description 2",
+                ]
+            ),
+            None,
+        ),
     ],
 )
 def test_validate_output_data(
@@ -594,40 +582,27 @@ def test_validate_output_data(
     assert result.equals(expected)
 
 
-@pytest.mark.parametrize(
-    ("new_campaign_row", "expected"),
-    [
-        (
-            pd.Series(
-                {
-                    "Country": "USA",
-                    "Include Location 1": "Croatia",
-                }
-            ),
-            "Croatia",
-        ),
-        (
-            pd.Series(
-                {
-                    "Country": "USA",
-                    "Include Location 1": "Croatia",
-                    "Include Location 2": "Slovenia",
-                }
-            ),
-            "Croatia-Slovenia",
-        ),
-        (
-            pd.Series(
-                {
-                    "Country": "USA",
-                }
-            ),
-            "Worldwide",
-        ),
-    ],
-)
-def test_get_target_location(new_campaign_row: pd.Series, expected: str) -> None:
-    assert _get_target_location(new_campaign_row) == expected
+def test_get_target_locations() -> None:
+    new_campaign_df = pd.DataFrame(
+        {
+            "Country": ["USA", "USA", "USA", "USA"],
+            "Include Location 1": ["Croatia", "Croatia", "", None],
+            "Include Location 2": ["", "Slovenia", "", None],
+        },
+        index=[3, 1, 2, 0],
+    )
+    expected = ["Croatia", "Croatia-Slovenia", "Worldwide", "Worldwide"]
+
+    assert _get_target_locations(new_campaign_df).tolist() == expected
+
+
+def test_get_target_locations_without_include_location_columns() -> None:
+    new_campaign_df = pd.DataFrame({"Country": ["USA", "USA"]})
+
+    assert _get_target_locations(new_campaign_df).tolist() == [
+        "Worldwide",
+        "Worldwide",
+    ]
 
 
 @pytest.mark.parametrize(
@@ -640,15 +615,13 @@ def test_get_target_location(new_campaign_row: pd.Series, expected: str) -> None
     ),
     [
         (
-            pd.Series(
-                {
-                    "Country": "USA",
-                    "Station From": "A",
-                    "Station To": "B",
-                    "Language Code": "EN",
-                    "Category": "Bus",
-                }
-            ),
+            {
+                "Country": "USA",
+                "Station From": "A",
+                "Station To": "B",
+                "Language Code": "EN",
+                "Category": "Bus",
+            },
             "{INSERT_COUNTRY} - {INSERT_STATION_FROM} - {INSERT_STATION_TO} - {INSERT_TARGET_LOCATION}",
             "EN",
             "C",
@@ -657,7 +630,7 @@ def test_get_target_location(new_campaign_row: pd.Series, expected: str) -> None
     ],
 )
 def test_update_campaign_name(
-    new_camaign_row: pd.Series,
+    new_camaign_row: Dict[str, Any],
     campaign_name: str,
     language_code: str,
     include_locations: str,
@@ -764,14 +737,12 @@ def test_validate_output_data_campaign(
     ("new_campaign_row", "expected"),
     [
         (
-            pd.Series(
-                {
-                    "Country": "USA",
-                    "Language Code": "EN",
-                    "Category": "Bus",
-                    "Ticket Price": "100",
-                }
-            ),
+            {
+                "Country": "USA",
+                "Language Code": "EN",
+                "Category": "Bus",
+                "Ticket Price": "100",
+            },
             pd.Series(
                 {
                     "Campaign Name": "USA - A - B",
@@ -785,14 +756,12 @@ def test_validate_output_data_campaign(
             ),
         ),
         (
-            pd.Series(
-                {
-                    "Country": "USA",
-                    "Language Code": "EN",
-                    "Category": "Bus",
-                    "Ticket Price": "",
-                }
-            ),
+            {
+                "Country": "USA",
+                "Language Code": "EN",
+                "Category": "Bus",
+                "Ticket Price": "",
+            },
             pd.Series(
                 {
                     "Campaign Name": "USA - A - B",
@@ -808,7 +777,7 @@ def test_validate_output_data_campaign(
     ],
 )
 def test_replace_values(
-    new_campaign_row: pd.Series,
+    new_campaign_row: Dict[str, Any],
     expected: pd.Series,
 ) -> None:
     new_row = pd.Series(
@@ -0,0 +1,9 @@
+from unittest.mock import MagicMock
+
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def stub_credentials_refresh(refresh_credentials: MagicMock) -> MagicMock:
+    # The credentials built by these tests are refreshed on first use
+    return refresh_credentials
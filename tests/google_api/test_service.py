@@ -0,0 +1,553 @@
+import asyncio
+import socket
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+from typing import Any, Dict, Iterator, List, Optional, Type, Union
+from unittest.mock import AsyncMock, MagicMock
+
+import httplib2
+import pytest
+from fastapi import HTTPException
+from google.auth.exceptions import RefreshError
+from google_auth_httplib2 import AuthorizedHttp
+from googleapiclient.errors import HttpError
+from pytest_mock import MockerFixture
+
+from google_sheets.google_api import service
+from google_sheets.model import GoogleSheetValues
+
+
+@pytest.fixture(autouse=True)
+def clear_caches() -> Iterator[None]:
+    service._credentials_cache.clear()
+    service._token_refreshes.clear()
+    yield
+    service._credentials_cache.clear()
+    service._token_refreshes.clear()
+
+
+@pytest.fixture
+def load_user_credentials(mocker: MockerFixture) -> AsyncMock:
+    return mocker.patch(
+        "google_sheets.google_api.service._load_user_credentials",
+        return_value={"refresh_token": "abcdf"},
+    )
+
+
+class TestConcurrencyLimits:
+    @pytest.mark.parametrize(
+        ("value", "expected"),
+        [(None, 7), ("3", 3), ("0", ValueError), ("-1", ValueError)],
+        ids=["default", "set", "zero", "negative"],
+    )
+    def test_positive_int_from_env(
+        self,
+        monkeypatch: pytest.MonkeyPatch,
+        value: Optional[str],
+        expected: Union[int, Type[Exception]],
+    ) -> None:
+        if value is not None:
+            monkeypatch.setenv("TEST_LIMIT", value)
+        if isinstance(expected, int):
+            assert service._positive_int_from_env("TEST_LIMIT", 7) == expected
+        else:
+            with pytest.raises(expected):
+                service._positive_int_from_env("TEST_LIMIT", 7)
+
+    @pytest.mark.asyncio
+    async def test_services_of_one_user_share_a_semaphore(
+        self, load_user_credentials: AsyncMock
+    ) -> None:
+        services = [await service.build_service(1, "sheets", "v4") for _ in range(2)]
+        other_service = await service.build_service(2, "sheets", "v4")
+
+        semaphore = service._service_semaphores[services[0]]
+        assert service._service_semaphores[services[1]] is semaphore
+        assert service._service_semaphores[other_service] is not semaphore
+
+    @pytest.mark.asyncio
+    async def test_calls_are_limited_by_the_service_semaphore(self) -> None:
+        sheets_service = MagicMock()
+        service._service_semaphores[sheets_service] = asyncio.Semaphore(2)
+        lock = threading.Lock()
+        running: List[int] = []
+        max_running = 0
+
+        @service._run_in_executor
+        def call(service: Any) -> None:
+            nonlocal max_running
+            with lock:
+                running.append(1)
+                max_running = max(max_running, len(running))
+            time.sleep(0.01)
+            with lock:
+                running.pop()
+
+        await asyncio.gather(*[call(sheets_service) for _ in range(6)])
+
+        assert max_running == 2
+
+
+class TestThreadLocalHttp:
+    def test_close_and_properties_use_the_thread_http(self) -> None:
+        http = service._ThreadLocalHttp()
+        authorized_http = AuthorizedHttp(MagicMock(), http=http)
+        thread_http = http._http()
+        assert isinstance(thread_http, httplib2.Http)
+        assert authorized_http.timeout == thread_http.timeout
+
+        authorized_http.close()
+        assert http._http() is not thread_http
+
+
+class TestGetUserCredentials:
+    @pytest.mark.asyncio
+    async def test_credentials_are_cached_until_ttl(
+        self, mocker: MockerFixture, load_user_credentials: AsyncMock
+    ) -> None:
+        monotonic = mocker.patch(
+            "google_sheets.google_api.service.monotonic", return_value=100.0
+        )
+
+        creds = await service._get_user_credentials(1)
+        monotonic.return_value = 100.0 + service.CREDENTIALS_TTL_SECONDS - 1
+        assert await service._get_user_credentials(1) is creds
+        assert load_user_credentials.await_count == 1
+
+        # The database is queried again, but the credentials are kept as long as
+        # the refresh token doesn't change
+        monotonic.return_value = 100.0 + service.CREDENTIALS_TTL_SECONDS
+        assert await service._get_user_credentials(1) is creds
+        assert load_user_credentials.await_count == 2
+
+        load_user_credentials.return_value = {"refresh_token": "new"}
+        monotonic.return_value = 100.0 + 2 * service.CREDENTIALS_TTL_SECONDS
+        new_creds = await service._get_user_credentials(1)
+        assert new_creds is not creds
+        assert new_creds.refresh_token == "new"
+
+    @pytest.mark.asyncio
+    async def test_invalidate_user_credentials(
+        self, load_user_credentials: AsyncMock
+    ) -> None:
+        await service._get_user_credentials(1)
+        await service._get_user_credentials(2)
+
+        service.invalidate_user_credentials(1)
+        service.invalidate_user_credentials(3)
+
+        assert list(service._credentials_cache) == [2]
+        await service._get_user_credentials(1)
+        assert load_user_credentials.await_count == 3
+
+
+class TestRefreshCredentials:
+    @pytest.mark.asyncio
+    async def test_invalid_credentials_are_refreshed_as_a_copy(
+        self, mocker: MockerFixture, load_user_credentials: AsyncMock
+    ) -> None:
+        loaded_creds = await service._load_credentials(1, None)
+        mocker.patch(
+            "google_sheets.google_api.service._load_credentials",
+            return_value=loaded_creds,
+        )
+
+        creds = await service._get_user_credentials(1)
+
+        assert creds is not loaded_creds
+        assert creds.valid
+        assert creds.refresh_token == loaded_creds.refresh_token
+        # The credentials handed out before are left untouched
+        assert loaded_creds.token is None
+        assert service._credentials_cache[1][1] is creds
+
+    @pytest.mark.asyncio
+    async def test_concurrent_requests_share_one_refresh(
+        self, load_user_credentials: AsyncMock, refresh_credentials: MagicMock
+    ) -> None:
+        await service._get_user_credentials(1)
+        creds = service._credentials_cache[1][1]
+        creds.expiry = datetime.now(timezone.utc).replace(tzinfo=None)
+        assert not creds.valid
+        refresh_credentials.reset_mock()
+
+        results = await asyncio.gather(
+            *[service._get_user_credentials(1) for _ in range(3)]
+        )
+
+        refresh_credentials.assert_called_once()
+        assert results[0] is results[1] is results[2]
+        assert results[0] is not creds
+        assert service._credentials_cache[1][1] is results[0]
+
+    @pytest.mark.asyncio
+    async def test_failed_refresh_evicts_credentials(
+        self, load_user_credentials: AsyncMock, refresh_credentials: MagicMock
+    ) -> None:
+        refresh_credentials.side_effect = RefreshError("invalid_grant")  # type: ignore[no-untyped-call]
+
+        # The request itself runs into the error again and handles it
+        creds = await service._get_user_credentials(1)
+
+        assert not creds.valid
+        assert 1 not in service._credentials_cache
+
+    @pytest.mark.asyncio
+    async def test_expiring_credentials_are_refreshed_in_background(
+        self,
+        mocker: MockerFixture,
+        load_user_credentials: AsyncMock,
+        refresh_credentials: MagicMock,
+    ) -> None:
+        for user_id in [1, 2, 3]:
+            await service._get_user_credentials(user_id)
+        expiring = {}
+        for user_id in [1, 2]:
+            loaded_at, creds = service._credentials_cache[user_id]
+            creds.expiry = datetime.now(timezone.utc).replace(tzinfo=None) + timedelta(
+                minutes=4
+            )
+            assert creds.valid
+            expiring[user_id] = creds
+        # Credentials not used within the TTL are dropped instead of refreshed
+        service._credentials_cache[2] = (
+            loaded_at - service.CREDENTIALS_TTL_SECONDS,
+            expiring[2],
+        )
+        refresh_credentials.reset_mock()
+
+        service._refresh_expiring_credentials()
+        await asyncio.gather(*service._token_refreshes.values())
+
+        refresh_credentials.assert_called_once()
+        assert service._credentials_cache[1][1] is not expiring[1]
+        assert not service._expires_soon(service._credentials_cache[1][1])
+        assert 2 not in service._credentials_cache
+        assert 3 in service._credentials_cache
+
+
+def _http_error(status: int) -> HttpError:
+    return HttpError(resp=SimpleNamespace(status=status, reason=""), content=b"")
+
+
+class TestAuthErrorEviction:
+    @pytest.mark.parametrize(
+        ("error", "evicted"),
+        [
+            (RefreshError("invalid_grant"), True),  # type: ignore[no-untyped-call]
+            (_http_error(401), True),
+            (_http_error(403), False),
+            (ValueError(), False),
+        ],
+        ids=["refresh_error", "unauthorized", "forbidden", "other"],
+    )
+    @pytest.mark.asyncio
+    async def test_auth_errors_evict_credentials(
+        self, load_user_credentials: AsyncMock, error: Exception, evicted: bool
+    ) -> None:
+        await service._get_user_credentials(1)
+        sheets_service = MagicMock()
+        service._service_users[sheets_service] = 1
+
+        @service._run_in_executor
+        def call(service: Any) -> None:
+            raise error
+
+        with pytest.raises(type(error)):
+            await call(sheets_service)
+
+        assert (1 not in service._credentials_cache) == evicted
+
+    @pytest.mark.asyncio
+    async def test_wrapped_auth_error_evicts_credentials(
+        self, load_user_credentials: AsyncMock
+    ) -> None:
+        await service._get_user_credentials(1)
+        sheets_service = MagicMock()
+        sheets_service.spreadsheets.return_value.values.return_value.get.return_value.execute.side_effect = RefreshError()  # type: ignore[no-untyped-call]
+        service._service_users[sheets_service] = 1
+
+        with pytest.raises(HTTPException):
+            await service.get_sheet_f(
+                service=sheets_service, spreadsheet_id="abc", range="Sheet1"
+            )
+
+        assert 1 not in service._credentials_cache
+
+
+class TestGetFiles:
+    @pytest.mark.asyncio
+    async def test_get_files_f_reads_all_pages(self) -> None:
+        drive_service = MagicMock()
+        files_list = drive_service.files.return_value.list
+        files_list.return_value.execute.side_effect = [
+            {"files": [{"id": "1", "name": "a"}], "nextPageToken": "token"},
+            {"files": [{"id": "2", "name": "b"}]},
+        ]
+
+        files = await service.get_files_f(service=drive_service)
+
+        assert files == [{"id": "1", "name": "a"}, {"id": "2", "name": "b"}]
+        assert [call.kwargs["pageToken"] for call in files_list.call_args_list] == [
+            None,
+            "token",
+        ]
+        # Spreadsheets in the trash are not listed
+        for call in files_list.call_args_list:
+            assert call.kwargs["q"] == (
+                "mimeType='application/vnd.google-apps.spreadsheet' and trashed=false"
+            )
+
+    @pytest.mark.parametrize(
+        ("kwargs", "expected_filter"),
+        [
+            ({}, ""),
+            ({"name_contains": "Template"}, " and name contains 'Template'"),
+            (
+                {"name_contains": "Bob's \\ sheet"},
+                " and name contains 'Bob\\'s \\\\ sheet'",
+            ),
+            ({"owned_only": True}, " and 'me' in owners"),
+            (
+                {"name_contains": "Template", "owned_only": True},
+                " and 'me' in owners and name contains 'Template'",
+            ),
+        ],
+        ids=["all", "name_contains", "escaped", "owned_only", "both"],
+    )
+    @pytest.mark.asyncio
+    async def test_get_files_f_query(
+        self, kwargs: Dict[str, Any], expected_filter: str
+    ) -> None:
+        drive_service = MagicMock()
+        files_list = drive_service.files.return_value.list
+        files_list.return_value.execute.return_value = {"files": []}
+
+        await service.get_files_f(service=drive_service, **kwargs)
+
+        assert files_list.call_args.kwargs["q"] == (
+            "mimeType='application/vnd.google-apps.spreadsheet' and trashed=false"
+            + expected_filter
+        )
+
+
+def _response_error(
+    status: int, content: bytes = b"", headers: Optional[Dict[str, str]] = None
+) -> HttpError:
+    return HttpError(
+        resp=httplib2.Response({"status": status, **(headers or {})}), content=content
+    )
+
+
+class TestExecute:
+    @pytest.fixture(autouse=True)
+    def sleep(self, mocker: MockerFixture) -> MagicMock:
+        return mocker.patch("google_sheets.google_api.service.sleep")
+
+    @pytest.mark.parametrize(
+        "error",
+        [
+            _response_error(503),
+            _response_error(429),
+            _response_error(
+                403,
+                content=b'{"error": {"message": "Quota exceeded", "errors": [{"reason": "rateLimitExceeded"}]}}',
+            ),
+            ConnectionResetError(),
+            TimeoutError(),
+            socket.timeout(),
+        ],
+        ids=[
+            "unavailable",
+            "too_many_requests",
+            "rate_limit",
+            "reset",
+            "timeout",
+            "socket_timeout",
+        ],
+    )
+    def test_retries_transient_errors(self, sleep: MagicMock, error: Exception) -> None:
+        request = MagicMock()
+        request.execute.side_effect = [error, error, {"values": []}]
+
+        assert service._execute(request) == {"values": []}
+
+        assert request.execute.call_count == 3
+        assert sleep.call_count == 2
+        # Randomized exponential backoff
+        assert 0 <= sleep.call_args_list[0].args[0] <= 1
+        assert 0 <= sleep.call_args_list[1].args[0] <= 2
+
+    def test_honors_retry_after(self, sleep: MagicMock) -> None:
+        request = MagicMock()
+        request.execute.side_effect = [
+            _response_error(429, headers={"retry-after": "7"}),
+            {},
+        ]
+
+        service._execute(request)
+
+        sleep.assert_called_once_with(7)
+
+    @pytest.mark.parametrize(
+        ("retry_after", "expected_sleeps"),
+        [("3600", 0), ("25", 2)],
+        ids=["too_long", "budget_used_up"],
+    )
+    def test_gives_up_when_retry_budget_is_exceeded(
+        self, sleep: MagicMock, retry_after: str, expected_sleeps: int
+    ) -> None:
+        request = MagicMock()
+        request.execute.side_effect = _response_error(
+            429, headers={"retry-after": retry_after}
+        )
+
+        with pytest.raises(HttpError):
+            service._execute(request)
+
+        # The wait that would go over the budget is not started
+        assert sleep.call_count == expected_sleeps
+        assert sum(call.args[0] for call in sleep.call_args_list) <= (
+            service.RETRY_BUDGET_SECONDS
+        )
+
+    @pytest.mark.parametrize(
+        "error",
+        [_response_error(400), _response_error(403), _response_error(404)],
+        ids=["bad_request", "forbidden", "not_found"],
+    )
+    def test_does_not_retry_other_errors(
+        self, sleep: MagicMock, error: HttpError
+    ) -> None:
+        request = MagicMock()
+        request.execute.side_effect = error
+
+        with pytest.raises(HttpError):
+            service._execute(request)
+
+        request.execute.assert_called_once()
+        sleep.assert_not_called()
+
+    def test_gives_up_after_num_retries(self, sleep: MagicMock) -> None:
+        request = MagicMock()
+        request.execute.side_effect = _response_error(503)
+
+        with pytest.raises(HttpError):
+            service._execute(request)
+
+        assert request.execute.call_count == service.NUM_RETRIES + 1
+
+    @pytest.mark.asyncio
+    async def test_adding_sheets_is_not_retried(self, sleep: MagicMock) -> None:
+        sheets_service = MagicMock()
+        execute = (
+            sheets_service.spreadsheets.return_value.batchUpdate.return_value.execute
+        )
+        execute.side_effect = _response_error(503)
+
+        with pytest.raises(HttpError):
+            await service.create_sheets_f(
+                service=sheets_service, spreadsheet_id="abc", titles=["A"]
+            )
+
+        execute.assert_called_once_with()
+
+
+class TestReadRequests:
+    @pytest.mark.asyncio
+    async def test_get_sheet_f_value_render_option(self) -> None:
+        sheets_service = MagicMock()
+        get = sheets_service.spreadsheets.return_value.values.return_value.get
+        get.return_value.execute.return_value = {"values": [[1]]}
+
+        values = await service.get_sheet_f(
+            service=sheets_service,
+            spreadsheet_id="abc",
+            range="A",
+            value_render_option="UNFORMATTED_VALUE",
+        )
+
+        assert values == [[1]]
+        get.assert_called_once_with(
+            spreadsheetId="abc",
+            range="A",
+            valueRenderOption="UNFORMATTED_VALUE",
+            fields="values",
+        )
+
+    @pytest.mark.asyncio
+    async def test_batch_get_sheets_f_value_render_option(self) -> None:
+        sheets_service = MagicMock()
+        batch_get = (
+            sheets_service.spreadsheets.return_value.values.return_value.batchGet
+        )
+        batch_get.return_value.execute.return_value = {
+            "valueRanges": [{"values": [["=A1"]]}, {}]
+        }
+
+        values = await service.batch_get_sheets_f(
+            service=sheets_service,
+            spreadsheet_id="abc",
+            ranges=["A", "B"],
+            value_render_option="FORMULA",
+        )
+
+        assert values == [[["=A1"]], []]
+        batch_get.assert_called_once_with(
+            spreadsheetId="abc",
+            ranges=["A", "B"],
+            valueRenderOption="FORMULA",
+            fields="valueRanges(values)",
+        )
+
+
+class TestWriteRequests:
+    @pytest.mark.asyncio
+    async def test_create_sheets_f(self) -> None:
+        sheets_service = MagicMock()
+
+        await service.create_sheets_f(
+            service=sheets_service, spreadsheet_id="abc", titles=["A", "B"]
+        )
+
+        batch_update = sheets_service.spreadsheets.return_value.batchUpdate
+        batch_update.assert_called_once_with(
+            spreadsheetId="abc",
+            body={
+                "requests": [
+                    {"addSheet": {"properties": {"title": "A"}}},
+                    {"addSheet": {"properties": {"title": "B"}}},
+                ]
+            },
+        )
+        batch_update.return_value.execute.assert_called_once()
+
+    @pytest.mark.asyncio
+    async def test_batch_update_sheets_f(self) -> None:
+        sheets_service = MagicMock()
+
+        await service.batch_update_sheets_f(
+            service=sheets_service,
+            spreadsheet_id="abc",
+            updates=[
+                ("A", GoogleSheetValues(values=[["a"], [1]])),
+                ("B", GoogleSheetValues(values=[["b"]])),
+            ],
+        )
+
+        batch_update = (
+            sheets_service.spreadsheets.return_value.values.return_value.batchUpdate
+        )
+        batch_update.assert_called_once_with(
+            spreadsheetId="abc",
+            body={
+                "valueInputOption": "RAW",
+                "data": [
+                    {"range": "A", "majorDimension": "ROWS", "values": [["a"], [1]]},
+                    {"range": "B", "majorDimension": "ROWS", "values": [["b"]]},
+                ],
+            },
+        )
+        batch_update.return_value.execute.assert_called_once()
@@ -0,0 +1,78 @@
+import asyncio
+from typing import Optional
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+from pytest_mock import MockerFixture
+
+from google_sheets import db_helpers
+from google_sheets.db_helpers import _get_db_url, db_clients, get_db_connection
+
+
+async def _get_two_connections() -> MagicMock:
+    async with db_clients() as clients:
+        async with get_db_connection("db://test") as db1:
+            pass
+        async with get_db_connection("db://test") as db2:
+            pass
+        assert db1 is db2
+        assert await clients.get("db://test?connect_timeout=60") is db1
+    assert db_helpers._active_db_clients.get() is None
+    return db1  # type: ignore[no-any-return]
+
+
+def test_db_clients_are_shared_within_one_event_loop(mocker: MockerFixture) -> None:
+    prisma = mocker.patch(
+        "google_sheets.db_helpers.Prisma",
+        side_effect=lambda **kwargs: MagicMock(
+            connect=AsyncMock(), disconnect=AsyncMock()
+        ),
+    )
+
+    # Each loop gets its own clients, which are disconnected when it ends
+    db1 = asyncio.run(_get_two_connections())
+    db2 = asyncio.run(_get_two_connections())
+
+    assert db1 is not db2
+    assert prisma.call_count == 2
+    for db in (db1, db2):
+        db.connect.assert_awaited_once()
+        db.disconnect.assert_awaited_once()
+
+
+def test_nested_db_clients_restore_the_outer_clients() -> None:
+    async def get_active_db_clients() -> Optional[db_helpers.DBClients]:
+        return db_helpers._active_db_clients.get()
+
+    async def enter_nested() -> None:
+        async with db_clients() as outer:
+            async with db_clients() as inner:
+                # Tasks started in the context share its clients
+                assert await asyncio.create_task(get_active_db_clients()) is inner
+            assert db_helpers._active_db_clients.get() is outer
+        assert db_helpers._active_db_clients.get() is None
+
+    asyncio.run(enter_nested())
+
+
+def test_get_db_connection_without_db_clients(mocker: MockerFixture) -> None:
+    db = MagicMock(connect=AsyncMock(), disconnect=AsyncMock())
+    mocker.patch("google_sheets.db_helpers.Prisma", return_value=db)
+
+    async def get_connection() -> None:
+        async with get_db_connection("db://test") as connection:
+            assert connection is db
+            db.disconnect.assert_not_awaited()
+
+    asyncio.run(get_connection())
+
+    db.connect.assert_awaited_once()
+    db.disconnect.assert_awaited_once()
+
+
+def test_get_db_url_reads_current_environment(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setenv("DATABASE_URL", "db://first")
+    assert _get_db_url() == "db://first?connect_timeout=60"
+
+    monkeypatch.setenv("DATABASE_URL", "db://second?connect_timeout=5")
+    assert _get_db_url() == "db://second?connect_timeout=5"